@@ -1,13 +1,19 @@
+import os
+import time
 import jinja2
 import uvicorn
+import threading
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.wsgi import WSGIMiddleware
-from fastapi.responses import RedirectResponse, HTMLResponse
-from public_housing import app as public_housing
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+import public_housing as ph
 from fastapi_blog import add_blog_to_fastapi
 import public_dash as pud
+from utils import data_process as dp
+import plotly
+from plotly.offline import get_plotlyjs
 # from private_housing import app as private_housing
 # from location_map import app as location_map
 
@@ -19,13 +25,87 @@ django_style_jinja2_loader = jinja2.ChoiceLoader([
 app = FastAPI()
 app = add_blog_to_fastapi(app, jinja2_loader=django_style_jinja2_loader)
 
+
+def write_plotlyjs(static_dir="static"):
+    """ Self host the plotly.js bundled with plotly, so the trends page
+    loads one cached copy instead of a CDN script per chart
+    """
+    file_name = f"js/plotly-{plotly.__version__}.min.js"
+    path = os.path.join(static_dir, file_name)
+    if not os.path.exists(path):
+        with dp.atomic_write(path) as tmp_path:
+            with open(tmp_path, "w") as f:
+                f.write(get_plotlyjs())
+    return f"/static/{file_name}"
+
+
+plotlyjs_url = write_plotlyjs()
+
 app.mount('/static', StaticFiles(directory='static'), name='static')
-app.mount("/public_housing", WSGIMiddleware(public_housing.server))
+app.mount("/public_housing", WSGIMiddleware(ph.app.server))
 # app.mount("/private_housing", WSGIMiddleware(private_housing.server))
 # app.mount("/location_map", WSGIMiddleware(location_map.server))
 templates = Jinja2Templates(directory='templates')
 
 
+# Hours between background data refreshes, and the seconds to wait before
+# retrying a failed load, doubling up to retry_max_seconds
+refresh_hours = float(os.environ.get("REFRESH_HOURS", 24))
+retry_seconds = 30
+retry_max_seconds = 1800
+
+
+def load_data():
+    """ Load dashboard data off the request path, so the app can serve
+    health checks and loading pages while data is pulled. A failed or
+    invalid load keeps the previous dataset in place. Returns whether
+    every module loaded
+    """
+    loaded = True
+    for module in [ph, pud]:
+        try:
+            module.load_data()
+        except Exception as e:
+            print(f"Failed to load data for {module.__name__}: {e}")
+            loaded = False
+    return loaded
+
+
+def refresh_data():
+    """ Load data at startup, then refresh it on a schedule. Failed loads
+    are retried with backoff, so a network blip does not last a day
+    """
+    delay = retry_seconds
+    while True:
+        if load_data():
+            delay = retry_seconds
+            time.sleep(refresh_hours * 3600)
+        else:
+            print(f"Retrying data load in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, retry_max_seconds)
+
+
+@app.on_event("startup")
+async def start_data_load():
+    threading.Thread(target=refresh_data, daemon=True).start()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    status = {
+        "public_housing": ph.data_ready.is_set(),
+        "public_dash": pud.data_ready.is_set(),
+    }
+    return JSONResponse(status, status_code=200 if all(
+        status.values()) else 503)
+
+
 @app.get("/public-homes")
 async def read_root(request: Request):
     return templates.TemplateResponse(
@@ -39,20 +119,15 @@ async def read_root(request: Request):
 
 @app.get("/sg-public-home-trends", response_class=HTMLResponse)
 async def sg_public_dash(request: Request):
+    if not pud.data_ready.is_set():
+        return templates.TemplateResponse(
+            "loading.html", {"request": request})
 
-    price_dist = pud.create_home_price_dist()
-    mil_bar_chart = pud.create_mil_bar_chart()
-    price_grp_counts = pud.create_price_grp_counts()
-    price_grp_percent = pud.create_price_grp_percent()
+    charts = pud.render_charts()
 
     return templates.TemplateResponse(
         "dash_v2.html", {
-            "request": request,
-            "price_dist": price_dist,
-            "mil_bar_chart": mil_bar_chart,
-            "price_grp_counts": price_grp_counts,
-            "price_grp_percent": price_grp_percent,
-        })
+            "request": request, "plotlyjs_url": plotlyjs_url, **charts})
 
 
 @app.get("/")
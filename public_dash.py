@@ -4,14 +4,18 @@
 # HDB Dashboard Creation Workflow
 import os
 import json
-import requests
+import hashlib
+import threading
 import polars as pl
 from datetime import datetime
 from pymongo import mongo_client
+import plotly.io as pio
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
+from utils import data_process as dp
+from utils import datagov as dg
+from utils import mongo_data as mdb
+from utils import shared_data as sd
 
 # MongoDB credentials
 MONGO_PASSWORD = os.environ["mongo_pw"]
@@ -19,79 +23,19 @@ base_url = "mongodb+srv://cliffchew84:"
 end_url = "cliff-nlb.t0whddv.mongodb.net/?retryWrites=true&w=majority"
 mongo_url = f"{base_url}{MONGO_PASSWORD}@{end_url}"
 
-# Update months in the latest year - Currently this is 2025-11
-db = mongo_client.MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
-db_nlb = db["nlb"]
-df = pl.DataFrame(list(db_nlb["hdb_hist_v2"].find({}, {"_id": 0})))
-
-current_date = datetime.today()
-period_range = pl.date_range(
-    datetime(year=2025, month=12, day=1),
-    current_date,
-    interval="1mo",
-    eager=True,
-).to_list()
-mths_2024 = [str(i)[:7] for i in period_range]
-
 
-# Parameters for making API calls for data.gov.sg
+# Columns used from data.gov.sg, which are also in the local cache
 df_cols = ["month", "town", "resale_price"]
-param_fields = ",".join(df_cols)
-base_url = "https://data.gov.sg/api/action/datastore_search?resource_id="
-ext_url = "d_8b84c4ee58e3cfc0ece0d773c8ca6abc"
-full_url = base_url + ext_url
 
 # New parameters for data.gov.sg
 api_key = os.environ["OGP_API_KEY"]
 headers = {"x-api-key": api_key}
 
-
-def fetch_hdb_data(period):
-    params = {
-        "fields": param_fields,
-        "filters": json.dumps({"month": period}),
-        "limit": 10000,
-    }
-    result = pl.DataFrame(schema=df_cols)
-    response = requests.get(full_url, params=params, headers=headers)
-    if response.status_code == 200:
-        table_result = pl.DataFrame(
-            response.json().get("result").get("records")
-        )
-        if table_result.columns != []:
-            result = table_result
-    return result
-
-
-# Use ThreadPoolExecutor to fetch data in parallel
-with ThreadPoolExecutor(max_workers=2) as executor:
-    futures = {
-        executor.submit(fetch_hdb_data, period): period for period in mths_2024
-    }
-
-    for future in as_completed(futures):
-        mth_df = future.result()
-        df = pl.concat([df, mth_df], how="vertical_relaxed")
-
 # Data Processing for creating charts
 bins = [300000, 500000, 800000, 1000000]
 labels = ["0-300k", "300-500k", "500-800k", "800k-1m", ">=1m"]
 
-df = (
-    df.filter("month" >= "2020-01-01")
-    .with_columns(
-        pl.lit(1).alias("count"), pl.col("resale_price").cast(pl.Float64)
-    )
-    .rename({"resale_price": "price"})
-    .with_columns(
-        pl.col("price")
-        .cut(breaks=bins, labels=labels, left_closed=True)
-        .alias("price_grp")
-    )
-)
-
-price_grps = df["price_grp"].unique().to_list()
-price_grps.sort()
+price_grps = sorted(labels)
 
 price_grps_dict = dict()
 price_grps_dict[price_grps[0]] = "#8BC1F7"
@@ -102,55 +46,249 @@ price_grps_dict[price_grps[4]] = "#C9190B"
 
 chart_width, chart_height = 1000, 600
 legend = dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-period_list = (
-    df.select(pl.col("month"))
-    .unique(maintain_order=True)
-    .to_series()
-    .to_list()
-)
-today = str(datetime.today().date())
-note = f"Updated on {today}"
+
+# Chart dataset, loaded by load_data instead of at import
+data = {"df": None, "summary": None, "note": None, "version": None}
+data_ready = threading.Event()
+
+# Plotly figure JSON of each chart, keyed by dataset version
+chart_cache = dict()
+chart_cache_dir = os.path.join(dg.cache_dir, "charts")
+chart_lock = threading.Lock()
+chart_format = "json-v1"
+
+
+def recent_months() -> list:
+    """Months not yet in the MongoDB history, pulled from data.gov.sg"""
+    period_range = pl.date_range(
+        datetime(year=2025, month=12, day=1),
+        datetime.today(),
+        interval="1mo",
+        eager=True,
+    ).to_list()
+    return [str(i)[:7] for i in period_range]
+
+
+def process_data(df: pl.DataFrame) -> pl.DataFrame:
+    """Add price groups used by the trend charts"""
+    return (
+        df.filter("month" >= "2020-01-01")
+        .with_columns(pl.col("resale_price").cast(pl.Float64))
+        .rename({"resale_price": "price"})
+        .with_columns(
+            pl.col("price")
+            .cut(breaks=bins, labels=labels, left_closed=True)
+            .alias("price_grp")
+        )
+    )
 
 
-# Home price distributions
-def create_home_price_dist(df=df, note=note):
-    p_count = df.group_by("month").agg(pl.col("price").median())
-    p_count = p_count.with_columns(
-        pl.when(pl.col("price") >= 500000)
-        .then(1)
-        .otherwise(0)
-        .alias("price_bar")
+def validate_data(df: pl.DataFrame):
+    """Raise ValueError if a freshly loaded dataset is unusable"""
+    if df.height == 0:
+        raise ValueError("Dataset has no transactions")
+    if df["price"].null_count() > 0:
+        raise ValueError("Dataset has transactions without prices")
+
+
+def build_data() -> dict:
+    """Load MongoDB history and recent months, validate them, and publish
+    them as a shared dataset version
+    """
+    # Client is created here, as resolving the mongodb+srv URL blocks
+    db = mongo_client.MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
+    df = mdb.load_history(db["nlb"]["hdb_hist_v2"])
+
+    # Read recent months concurrently, via the local cache
+    recent_df = dg.load_hdb_months(recent_months(), headers, max_concurrency=2)
+    df = pl.concat([df, recent_df.select(df_cols)], how="vertical_relaxed")
+
+    df = process_data(df)
+    validate_data(df)
+
+    note = f"Updated on {datetime.today().date()}"
+    version = dataset_version(df, note)
+    sd.publish_frame(df, "public_dash", version, note=note)
+    return {"version": version, "note": note}
+
+
+def load_data():
+    """Map the latest shared dataset, building it if no worker has done
+    so recently, render its charts, then swap it in as the dataset used
+    for charts
+    """
+    global data
+
+    with sd.build_lock("public_dash"):
+        published = sd.latest_version("public_dash", dg.fresh_hours)
+        if published is None:
+            published = build_data()
+
+    if published["version"] == data["version"]:
+        data_ready.set()
+        return
+
+    df = sd.open_frame("public_dash", published["version"])
+    note = published["note"]
+    new_data = {
+        "df": df,
+        "summary": update_summary(data["summary"], df),
+        "note": note,
+        "version": published["version"],
+    }
+
+    # Charts are ready before the new dataset is visible to requests
+    build_and_cache_charts(new_data)
+    data = new_data
+    data_ready.set()
+
+
+def dataset_version(df: pl.DataFrame, note: str) -> str:
+    """Version that only changes when chart inputs change"""
+    key = f"{note}|{df.height}|{df['month'].max()}|{df['price'].sum()}"
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def summarise_months(df: pl.DataFrame) -> pl.DataFrame:
+    """Per month count, box plot statistics, million dollar count and
+    price group counts, which the chart builders use instead of raw rows
+    """
+    q1 = pl.col("price").quantile(0.25, "linear")
+    q3 = pl.col("price").quantile(0.75, "linear")
+    in_fence = pl.col("price").is_between(
+        q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
     )
 
-    high_prices = (
-        p_count.filter(pl.col("price_bar") == 1)
-        .select("month")
-        .to_series()
-        .to_list()
+    base = df.group_by("month").agg(
+        pl.len().alias("count"),
+        q1.alias("q1"),
+        pl.col("price").median().alias("median"),
+        q3.alias("q3"),
+        pl.col("price").filter(in_fence).min().alias("lowerfence"),
+        pl.col("price").filter(in_fence).max().alias("upperfence"),
+        pl.col("price").filter(~in_fence).alias("outliers"),
+        (pl.col("price") >= 1000000).sum().alias("mil_count"),
+    )
+    grp_counts = (
+        df.group_by(["month", "price_grp"])
+        .agg(pl.len().alias("count"))
+        .with_columns(pl.col("price_grp").cast(pl.String))
+        .pivot(on="price_grp", index="month", values="count")
+    )
+    # Months are Enums over the labels of one version, so summaries of
+    # different versions are joined on plain strings
+    summary = base.join(grp_counts, on="month", how="left")
+    return summary.with_columns(
+        [pl.col("month").cast(pl.String)]
+        + [
+            (
+                pl.col(i).fill_null(0)
+                if i in summary.columns
+                else pl.lit(0, dtype=pl.UInt32).alias(i)
+            )
+            for i in price_grps
+        ]
+    ).sort("month")
+
+
+def update_summary(summary: pl.DataFrame, df: pl.DataFrame) -> pl.DataFrame:
+    """Only summarise months from the last summarised month onwards, as
+    closed months in the history do not change
+    """
+    if summary is None or summary.height == 0:
+        return summarise_months(df)
+
+    last_mth = summary["month"].max()
+    new_summary = summarise_months(df.filter(pl.col("month") >= last_mth))
+    return pl.concat(
+        [summary.filter(pl.col("month") < last_mth), new_summary],
+        how="diagonal_relaxed",
+    ).sort("month")
+
+
+def figure_json(fig: go.Figure) -> str:
+    """Compact figure JSON for client side rendering with a self hosted
+    plotly.js. Numpy arrays are binary encoded by newer plotly versions
+    """
+    return pio.to_json(fig, validate=False, pretty=False)
+
+
+def current_data(df=None, summary=None, note=None):
+    """Default chart inputs to the loaded dataset"""
+    current = data
+    df = current["df"] if df is None else df
+    summary = current["summary"] if summary is None else summary
+    note = current["note"] if note is None else note
+    return df, summary, note
+
+
+# Home price distributions
+def create_home_price_dist(df=None, summary=None, note=None, precomputed=True):
+    """Box plots of monthly prices. With precomputed, boxes are drawn
+    from summary statistics and only outliers are sent to Plotly
+    """
+    df, summary, note = current_data(df, summary, note)
+    summary = summary.with_columns(
+        (pl.col("median") >= 500000).alias("high_price")
     )
 
     fig = go.Figure()
-    for p in period_list:
-        tmp = df.filter(pl.col("month") == p)
-        if p in high_prices:
+    if precomputed:
+        for high_price, color in [(False, "#06C"), (True, "#C9190B")]:
+            box = summary.filter(pl.col("high_price") == high_price)
+            outliers = box.select("month", "outliers").explode("outliers")
             fig.add_trace(
                 go.Box(
-                    y=tmp.select("price").to_series(),
-                    name=str(p),
-                    boxpoints="outliers",
-                    marker_color="#C9190B",
-                    line_color="#C9190B",
+                    x=box.select("month").to_series().to_list(),
+                    q1=box.select("q1").to_series().round(0).to_numpy(),
+                    median=box.select("median")
+                    .to_series()
+                    .round(0)
+                    .to_numpy(),
+                    q3=box.select("q3").to_series().round(0).to_numpy(),
+                    lowerfence=box.select("lowerfence")
+                    .to_series()
+                    .round(0)
+                    .to_numpy(),
+                    upperfence=box.select("upperfence")
+                    .to_series()
+                    .round(0)
+                    .to_numpy(),
+                    marker_color=color,
+                    line_color=color,
                     showlegend=False,
                 )
             )
-        else:
+            fig.add_trace(
+                go.Scatter(
+                    x=outliers.select("month").to_series().to_list(),
+                    y=outliers.select("outliers")
+                    .to_series()
+                    .round(0)
+                    .to_numpy(),
+                    mode="markers",
+                    marker=dict(size=4, color=color),
+                    hoverinfo="y",
+                    showlegend=False,
+                )
+            )
+    else:
+        high_prices = (
+            summary.filter(pl.col("high_price"))
+            .select("month")
+            .to_series()
+            .to_list()
+        )
+        for p in summary.select("month").to_series().to_list():
+            tmp = df.filter(pl.col("month") == p)
+            color = "#C9190B" if p in high_prices else "#06C"
             fig.add_trace(
                 go.Box(
                     y=tmp.select("price").to_series(),
                     name=str(p),
                     boxpoints="outliers",
-                    marker_color="#06C",
-                    line_color="#06C",
+                    marker_color=color,
+                    line_color=color,
                     showlegend=False,
                 )
             )
@@ -177,41 +315,28 @@ def create_home_price_dist(df=df, note=note):
     fig.update_layout(
         title="Public Home Price Distributions",
         yaxis={"title": "Prices (SGD)"},
-        xaxis={"title": "Months"},
+        xaxis={
+            "title": "Months",
+            "type": "category",
+            "categoryorder": "category ascending",
+        },
         width=chart_width,
         height=chart_height,
         legend=legend,
     )
-    return fig.to_html(full_html=False, include_plotlyjs="cdn")
+    return figure_json(fig)
 
 
 # Advanced Million Dollar Homes
-def create_mil_bar_chart(df=df, note=note):
-    mil = (
-        df.with_columns(
-            pl.when(pl.col("price") >= 1000000)
-            .then(1)
-            .otherwise(0)
-            .alias("mil")
-        )
-        .group_by(["month", "mil"])
-        .agg(pl.col("town").count())
-        .sort("month")
-        .pivot(
-            on="mil", index="month", values="town", aggregate_function="sum"
-        )
-        .fill_null(0)
-        .with_columns((pl.col("1") + pl.col("0")).alias("All"))
-        .with_columns(
-            ((pl.col("1") / pl.col("All")) * 100).round(2).alias("prop")
-        )
-        .rename(
-            {
-                "1": "million $ Trans",
-                "All": "Total Trans",
-                "prop": "% million Trans",
-            }
-        )
+def create_mil_bar_chart(summary=None, note=None):
+    _, summary, note = current_data(summary=summary, note=note)
+    mil = summary.select(
+        "month",
+        pl.col("mil_count").alias("million $ Trans"),
+        pl.col("count").alias("Total Trans"),
+        ((pl.col("mil_count") / pl.col("count")) * 100)
+        .round(2)
+        .alias("% million Trans"),
     )
 
     title = f"% of Million Dollar Homes & Total Homes Sold<br>{note}"
@@ -255,26 +380,21 @@ def create_mil_bar_chart(df=df, note=note):
     fig.add_hline(y=1, line_width=1.5, line_dash="dash", line_color="black")
     fig.add_hline(y=3, line_width=1.5, line_dash="dash", line_color="purple")
     fig.add_hline(y=4, line_width=1.5, line_dash="dash", line_color="red")
-    return fig.to_html(full_html=False, include_plotlyjs="cdn")
+    return figure_json(fig)
 
 
 # Stacked Bar Values
-def create_price_grp_counts(df=df, note=note):
-    pg_plots = df.group_by(["month", "price_grp"]).agg(pl.col("count").sum())
+def create_price_grp_counts(summary=None, note=None):
+    _, summary, note = current_data(summary=summary, note=note)
+    months = summary.select("month").to_series().to_list()
 
     fig = go.Figure()
     for i in price_grps:
         fig.add_trace(
             go.Bar(
                 name=i,
-                x=pg_plots.filter(pl.col("price_grp") == i)
-                .select("month")
-                .to_series()
-                .to_list(),
-                y=pg_plots.filter(pl.col("price_grp") == i)
-                .select("count")
-                .to_series()
-                .to_list(),
+                x=months,
+                y=summary.select(i).to_series().to_list(),
                 marker_color=price_grps_dict[i],
             )
         )
@@ -289,19 +409,14 @@ def create_price_grp_counts(df=df, note=note):
         height=chart_height,
         legend=legend,
     )
-    return fig.to_html(full_html=False, include_plotlyjs="cdn")
-
+    return figure_json(fig)
 
-def create_price_grp_percent(df=df, note=note):
-    pg_base = df.group_by("month").agg(pl.col("count").sum())
-    pg_plots = df.group_by(["month", "price_grp"]).agg(pl.col("count").sum())
-    for_plots = pg_plots.join(pg_base, on="month")
 
-    for_plots.columns = ["month", "price_grp", "count", "total"]
-    for_plots = for_plots.with_columns(
-        (100 * pl.col("count") / pl.col("total"))
-        .round(1)
-        .alias("percent_count")
+def create_price_grp_percent(summary=None, note=None):
+    _, summary, note = current_data(summary=summary, note=note)
+    months = summary.select("month").to_series().to_list()
+    for_plots = summary.select(
+        [(pl.col(i) * 100 / pl.col("count")).round(1) for i in price_grps]
     )
 
     fig = go.Figure()
@@ -309,14 +424,8 @@ def create_price_grp_percent(df=df, note=note):
         fig.add_trace(
             go.Bar(
                 name=i,
-                x=for_plots.filter(pl.col("price_grp") == i)
-                .select("month")
-                .to_series()
-                .to_list(),
-                y=for_plots.filter(pl.col("price_grp") == i)
-                .select("percent_count")
-                .to_series()
-                .to_list(),
+                x=months,
+                y=for_plots.select(i).to_series().to_list(),
                 marker_color=price_grps_dict[i],
             )
         )
@@ -332,4 +441,82 @@ def create_price_grp_percent(df=df, note=note):
         height=chart_height,
         legend=legend,
     )
-    return fig.to_html(full_html=False, include_plotlyjs="cdn")
+    return figure_json(fig)
+
+
+def build_charts(current: dict) -> dict:
+    """Figure JSON of all trend charts for a dataset"""
+    df, summary, note = current["df"], current["summary"], current["note"]
+    return {
+        "price_dist": create_home_price_dist(df, summary, note),
+        "mil_bar_chart": create_mil_bar_chart(summary, note),
+        "price_grp_counts": create_price_grp_counts(summary, note),
+        "price_grp_percent": create_price_grp_percent(summary, note),
+    }
+
+
+def chart_path(version: str) -> str:
+    return os.path.join(
+        chart_cache_dir, f"charts_{chart_format}_{version}.json"
+    )
+
+
+def remove_old_charts():
+    """Keep chart files of the newest dataset versions on disk, including
+    files of older chart formats
+    """
+    files = sorted(
+        (
+            i
+            for i in os.listdir(chart_cache_dir)
+            if i.startswith("charts_") and i.endswith(".json")
+        ),
+        key=lambda i: os.path.getmtime(os.path.join(chart_cache_dir, i)),
+    )
+    for i in files[: -sd.keep_versions]:
+        os.remove(os.path.join(chart_cache_dir, i))
+
+
+def build_and_cache_charts(current: dict) -> dict:
+    """Render charts for a dataset version once, sharing them via disk"""
+    version = current["version"]
+    with chart_lock:
+        if version in chart_cache:
+            return chart_cache[version]
+
+        path = chart_path(version)
+        if os.path.exists(path):
+            with open(path) as f:
+                charts = json.load(f)
+        else:
+            charts = build_charts(current)
+            with dp.atomic_write(path) as tmp_path:
+                with open(tmp_path, "w") as f:
+                    json.dump(charts, f)
+            remove_old_charts()
+
+        # Keep the latest two versions, so a swap never misses the cache
+        chart_cache[version] = charts
+        while len(chart_cache) > 2:
+            chart_cache.pop(next(iter(chart_cache)))
+        return charts
+
+
+def render_charts(stale_while_revalidate: bool = True) -> dict:
+    """Chart JSON for the current dataset version. With
+    stale_while_revalidate, charts of an older version are served while
+    the new version renders in the background
+    """
+    current = data
+    charts = chart_cache.get(current["version"])
+    if charts is not None:
+        return charts
+
+    if stale_while_revalidate and chart_cache and not chart_lock.locked():
+        stale = next(reversed(chart_cache.values()))
+        threading.Thread(
+            target=build_and_cache_charts, args=(current,), daemon=True
+        ).start()
+        return stale
+
+    return build_and_cache_charts(current)
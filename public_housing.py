@@ -1,140 +1,221 @@
 from dash import Dash, html, dcc, Input, Output, callback, State
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dash import clientside_callback, no_update
+from contextlib import contextmanager
+from functools import lru_cache
 import dash_bootstrap_components as dbc
-from datetime import datetime, date
+from datetime import datetime
 import plotly.graph_objects as go
 import dash_ag_grid as dag
+from utils import data_process as dp
+from utils import datagov as dg
+from utils import shared_data as sd
+from utils import geocode as geo
 import polars as pl
-import requests
+import numpy as np
+import threading
 import json
+import time
 
-# Get current month and recent periods
-current_mth = datetime.now().date().strftime("%Y-%m")
-periods = [
-    str(i)[:7]
-    for i in pl.date_range(
-        datetime(2024, 3, 1), datetime.now(), interval="1mo", eager=True
-    ).to_list()
-]
 
-# Allows for first 10 days of a month to still include 7th month ago data
-recent_periods = periods[-7:] if datetime.now().day <= 10 else periods[-6:]
-
-# Define columns and URL
-df_cols = [
-    "month",
-    "block",
-    "town",
-    "flat_type",
-    "street_name",
-    "storey_range",
-    "floor_area_sqm",
-    "remaining_lease",
-    "resale_price",
-]
-param_fields = ",".join(df_cols)
-base_url = "https://data.gov.sg/api/action/datastore_search?resource_id="
-ext_url = "d_8b84c4ee58e3cfc0ece0d773c8ca6abc"
-full_url = base_url + ext_url
-empty_df = pl.DataFrame(schema=df_cols)
-
-
-# Function to make an API request
-def fetch_hdb_data(period):
-    params = {
-        "fields": param_fields,
-        "filters": json.dumps({"month": period}),
-        "limit": 10000,
-    }
-    result = empty_df
-    response = requests.get(full_url, params=params)
-    if response.status_code == 200:
-        table_result = pl.DataFrame(
-            response.json().get("result").get("records")
-        )
-        if table_result.columns != []:
-            result = table_result
-    return result
+def recent_months():
+    """Months to pull from data.gov.sg, and the 6 months shown"""
+    periods = [
+        str(i)[:7]
+        for i in pl.date_range(
+            datetime(2024, 3, 1), datetime.now(), interval="1mo", eager=True
+        ).to_list()
+    ]
 
+    # Allows for first 10 days of a month to still include 7th month ago data
+    recent_periods = periods[-7:] if datetime.now().day <= 10 else periods[-6:]
+    return recent_periods, periods[-6:]
 
-# Use ThreadPoolExecutor to fetch data in parallel
-df = empty_df
-with ThreadPoolExecutor(max_workers=4) as executor:
-    futures = {
-        executor.submit(fetch_hdb_data, period): period
-        for period in recent_periods
-    }
 
-    for future in as_completed(futures):
-        mth_df = future.result()
-        df = pl.concat([df, mth_df], how="vertical_relaxed")
-
-# Data Processing
-df.columns = [
-    "month",
-    "block",
-    "town",
-    "flat",
-    "street",
-    "floor",
-    "area_sqm",
-    "lease_mths",
-    "price",
-]
+# Server-resident datasets keyed by version. The browser only holds the
+# version and sends filter parameters back, instead of the whole dataset.
+# A snapshot is replaced as a whole, so refreshes swap it atomically.
+# Each version holds its frame and row id index together.
+snapshot = {"version": None, "datasets": {}}
+data_ready = threading.Event()
+required_cols = ["month", "town", "flat", "street", "lease_mths", "price"]
+index_cols = ["town", "flat", "month"]
 
-yr, mth = datetime.now().year, datetime.now().month
-selected_mths = pl.date_range(
-    date(2024, 1, 1), date(yr, mth, 1), "1mo", eager=True
-).to_list()
-selected_mths = [i.strftime("%Y-%m") for i in selected_mths[-int(6) :]]
+# New addresses geocoded after each build, so the store fills over
+# refreshes without delaying a publish
+geocode_batch = 500
 
-df = (
-    df.filter(pl.col("month").is_in(selected_mths))
-    .with_columns(
-        [
-            pl.col("area_sqm").cast(pl.Float32),
-            pl.col("price").cast(pl.Float32),
-            (pl.col("area_sqm").cast(pl.Float32) * 10.7639).alias("area_sqft"),
-            (
-                pl.col("price").cast(pl.Float32)
-                / pl.col("area_sqm").cast(pl.Float32)
-            ).alias("price_sqm"),
-            (
-                pl.col("price").cast(pl.Float32)
-                / (pl.col("area_sqm").cast(pl.Float32) * 10.7639)
-            ).alias("price_sqft"),
-            ("BLK " + pl.col("block") + " " + pl.col("street")).alias(
-                "street"
-            ),
-            pl.col("lease_mths")
-            .str.replace("s", "")
-            .str.replace(" year", "y")
-            .str.replace(" month", "m")
-            .alias("lease"),
-            pl.col("flat")
-            .str.replace(" ROOM", "RM")
-            .str.replace("EXECUTIVE", "EC")
-            .str.replace("MULTI-GENERATION", "MG")
-            .alias("flat"),
-            pl.col("floor").str.replace(" TO ", "-").alias("floor"),
-        ]
-    )
-    .select(
+
+def process_data(df: pl.DataFrame, selected_mths: list) -> pl.DataFrame:
+    """Clean data.gov.sg records into the dashboard dataset, with a
+    compact schema that filters use without parsing strings
+    """
+    df.columns = [
         "month",
+        "block",
         "town",
         "flat",
         "street",
         "floor",
-        "lease",
         "area_sqm",
-        "area_sqft",
-        "price_sqm",
-        "price_sqft",
+        "lease_mths",
         "price",
+    ]
+
+    # Remaining lease such as "61 years 04 months" as a count of months
+    lease_parts = pl.col("lease_mths").str.extract_all(r"\d+")
+    lease_years = lease_parts.list.get(0).cast(pl.Int16)
+    lease_months = lease_parts.list.get(1, null_on_oob=True).cast(pl.Int16)
+    lease_mths = lease_years * 12 + lease_months.fill_null(0)
+
+    return (
+        df.filter(pl.col("month").is_in(selected_mths))
+        .with_columns(
+            [
+                (pl.col("month") + "-01").str.to_date("%Y-%m-%d"),
+                pl.col("area_sqm").cast(pl.Float32),
+                pl.col("price").cast(pl.Float32),
+                (pl.col("area_sqm").cast(pl.Float32) * 10.7639).alias(
+                    "area_sqft"
+                ),
+                (
+                    pl.col("price").cast(pl.Float32)
+                    / pl.col("area_sqm").cast(pl.Float32)
+                ).alias("price_sqm"),
+                (
+                    pl.col("price").cast(pl.Float32)
+                    / (pl.col("area_sqm").cast(pl.Float32) * 10.7639)
+                ).alias("price_sqft"),
+                ("BLK " + pl.col("block") + " " + pl.col("street")).alias(
+                    "street"
+                ),
+                lease_mths.alias("lease_mths"),
+                (lease_mths // 12).cast(pl.Int16).alias("year_count"),
+                pl.col("town").cast(pl.Categorical),
+                pl.col("flat")
+                .str.replace(" ROOM", "RM")
+                .str.replace("EXECUTIVE", "EC")
+                .str.replace("MULTI-GENERATION", "MG")
+                .cast(pl.Categorical)
+                .alias("flat"),
+                pl.col("floor")
+                .str.replace(" TO ", "-")
+                .cast(pl.Categorical)
+                .alias("floor"),
+            ]
+        )
+        .select(
+            "month",
+            "town",
+            "flat",
+            "street",
+            "floor",
+            "lease_mths",
+            "year_count",
+            "area_sqm",
+            "area_sqft",
+            "price_sqm",
+            "price_sqft",
+            "price",
+        )
     )
-)
 
-print("Completed data extraction from data.gov.sg")
+
+def validate_data(df: pl.DataFrame):
+    """Raise ValueError if a freshly loaded dataset is unusable"""
+    missing = [i for i in required_cols if i not in df.columns]
+    if missing:
+        raise ValueError(f"Dataset is missing columns {missing}")
+    if df.height == 0:
+        raise ValueError("Dataset has no transactions")
+    if df["price"].null_count() > 0:
+        raise ValueError("Dataset has transactions without prices")
+
+
+def build_data() -> str:
+    """Read recent months via the local cache, validate them, and publish
+    them as a shared dataset version
+    """
+    recent_periods, selected_mths = recent_months()
+    df = dg.load_hdb_months(recent_periods, max_concurrency=4)
+    df = process_data(df, selected_mths)
+    validate_data(df)
+
+    # Only addresses already in the store get coordinates. Each month is
+    # then one contiguous slice, so month windows are cheap
+    df = geo.add_coordinates(df, geo.load_geocodes())
+    df = df.sort("month", maintain_order=True)
+
+    version = datetime.now().strftime("%Y%m%d%H%M%S")
+    sd.publish_frame(df, "public_housing", version)
+
+    # New addresses are geocoded after publishing, for the next build
+    threading.Thread(
+        target=geo.update_geocodes,
+        args=(df["street"].unique().to_list(),),
+        kwargs={"limit": geocode_batch},
+        daemon=True,
+    ).start()
+    return version
+
+
+def load_data():
+    """Map the latest shared dataset, building it if no worker has done
+    so recently, and swap it in as the latest dataset. The previous
+    version is kept, so open pages can still query it
+    """
+    global snapshot
+
+    with sd.build_lock("public_housing"):
+        published = sd.latest_version("public_housing", dg.fresh_hours)
+        version = published["version"] if published else build_data()
+
+    if version == snapshot["version"]:
+        data_ready.set()
+        return
+
+    df = sd.open_frame("public_housing", version)
+    datasets = {version: (df, build_index(df))}
+    if snapshot["version"] is not None:
+        datasets[snapshot["version"]] = get_data()
+
+    snapshot = {"version": version, "datasets": datasets}
+    data_ready.set()
+    print(f"Completed data extraction from data.gov.sg, version {version}")
+
+
+def get_data(version=None) -> tuple:
+    """Return (dataset, index) for a version, falling back to the latest
+    version. Both come from one snapshot read, so they always match
+    """
+    current = snapshot
+    datasets = current["datasets"]
+    return datasets.get(version, datasets[current["version"]])
+
+
+def get_dataset(version=None) -> pl.DataFrame:
+    """Return dataset for a version, falling back to the latest version"""
+    return get_data(version)[0]
+
+
+def build_index(df: pl.DataFrame) -> dict:
+    """Row id indexes for equality filters and street search"""
+    index = dp.build_row_index(df, index_cols)
+    index["street"] = dp.build_street_index(df["street"])
+    return index
+
+
+def window_start(index: dict, months) -> int:
+    """First row of the latest N months, as rows are sorted by month"""
+    periods = sorted(index["month"])
+    if not months or not periods:
+        return 0
+    return int(index["month"][periods[-int(months) :][0]][0])
+
+
+def get_index(version=None) -> dict:
+    """Row id index of a dataset, falling back to the latest version"""
+    return get_data(version)[1]
+
 
 # Initalise App
 app = Dash(
@@ -144,45 +225,52 @@ app = Dash(
         dbc.themes.BOOTSTRAP,
     ],
     requests_pathname_prefix="/public_housing/",
+    suppress_callback_exceptions=True,
 )
 
-# Chart parameters
-towns = df.select("town").unique().to_series().to_list()
-towns.sort()
-towns = [
-    "All",
-] + towns
 
-flat_type_grps = df.select("flat").unique().to_series().to_list()
-flat_type_grps.sort()
+def filter_options(df: pl.DataFrame):
+    """Town and flat type dropdown options for a dataset"""
+    towns = df.select("town").unique().to_series().to_list()
+    towns.sort()
+    towns = [
+        "All",
+    ] + towns
 
-final_flat_type_grps = []
-for flat in flat_type_grps:
-    final_flat_type_grps.append(
-        {
-            "label": html.Span(
-                [flat],
-                style={
-                    "background-color": "#FFC0BD",
-                    "border": "#FFC0BD",
-                    "color": "black",
-                },
-            ),
-            "value": flat,
-            "search": flat,
-        }
-    )
+    flat_type_grps = df.select("flat").unique().to_series().to_list()
+    flat_type_grps.sort()
+
+    final_flat_type_grps = []
+    for flat in flat_type_grps:
+        final_flat_type_grps.append(
+            {
+                "label": html.Span(
+                    [flat],
+                    style={
+                        "background-color": "#FFC0BD",
+                        "border": "#FFC0BD",
+                        "color": "black",
+                    },
+                ),
+                "value": flat,
+                "search": flat,
+            }
+        )
+    return towns, flat_type_grps, final_flat_type_grps
 
-period_grps = df.select("month").unique().to_series().to_list()
-price_max = df.select("price").max().rows()[0][0]
-price_min = df.select("price").min().rows()[0][0]
-area_max = df.select("area_sqft").max().rows()[0][0]
-area_min = df.select("area_sqft").min().rows()[0][0]
 
 legend = dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0.5)
 chart_width, chart_height = 680, 550
 
 
+@contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Record elapsed milliseconds of a callback stage into timings"""
+    start = time.perf_counter()
+    yield
+    timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
 def convert_price_area(price_type, area_type):
     """Convert user price for table ftilers Plotly labels"""
 
@@ -250,608 +338,681 @@ def df_filter(
     price_type,
     max_price,
     min_price,
-    min_lease,
     max_lease,
+    min_lease,
     street,
-    selected_mths,
-    data_json,
+    version,
 ):
     """Filter Polars DataFrame for Viz, based on inputs"""
-    df = pl.DataFrame(json.loads(data_json)).lazy()
-
-    # Conditional flags
-    flags = []
+    df, index = get_data(version)
 
-    df = df.with_columns(
-        pl.col("lease")
-        .str.split("y")
-        .list.get(0)
-        .cast(pl.Int32)
-        .alias("year_count")
-    )
-
-    if max_lease:
-        flags.append(
-            pl.when(pl.col("year_count") >= int(max_lease))
-            .then(True)
-            .otherwise(False)
-            .alias("max_lease_flag")
+    # Town and flat pick candidate rows from the index, so the remaining
+    # predicates only run on those candidates instead of the whole frame
+    rows = dp.lookup_rows(index, "flat", flat)
+    if town != "All":
+        rows = dp.intersect_rows(
+            rows, dp.lookup_rows(index, "town", [town]), df.height
         )
 
+    # Remaining conditions are combined into a single selection mask
+    conditions = []
+
     if min_lease:
-        flags.append(
-            pl.when(pl.col("year_count") <= int(min_lease))
-            .then(True)
-            .otherwise(False)
-            .alias("min_lease_flag")
-        )
+        conditions.append(pl.col("year_count") >= int(min_lease))
 
-    flags.append(
-        pl.when(pl.col("flat").is_in(flat))
-        .then(True)
-        .otherwise(False)
-        .alias("flat_flag")
-    )
+    if max_lease:
+        conditions.append(pl.col("year_count") <= int(max_lease))
 
     if street:
-        flags.append(
-            pl.when(pl.col("street").str.contains(street.upper()))
-            .then(True)
-            .otherwise(False)
-            .alias("street_flag")
-        )
-
-    # Conditional flags for town, price, and area
-    if town != "All":
-        flags.append(
-            pl.when(pl.col("town") == town)
-            .then(True)
-            .otherwise(False)
-            .alias("town_flag")
+        rows = dp.intersect_rows(
+            rows, dp.search_streets(index["street"], street), df.height
         )
 
+    # Conditions for price and area
     if max_price:
-        flags.append(
-            pl.when(pl.col(price_type) <= max_price)
-            .then(True)
-            .otherwise(False)
-            .alias("max_price_flag")
-        )
+        conditions.append(pl.col(price_type) <= max_price)
 
     if min_price:
-        flags.append(
-            pl.when(pl.col(price_type) >= min_price)
-            .then(True)
-            .otherwise(False)
-            .alias("min_price_flag")
-        )
+        conditions.append(pl.col(price_type) >= min_price)
 
     if max_area:
-        flags.append(
-            pl.when(pl.col(area_type) <= max_area)
-            .then(True)
-            .otherwise(False)
-            .alias("max_area_flag")
-        )
+        conditions.append(pl.col(area_type) <= max_area)
 
     if min_area:
-        flags.append(
-            pl.when(pl.col(area_type) >= min_area)
-            .then(True)
-            .otherwise(False)
-            .alias("min_area_flag")
+        conditions.append(pl.col(area_type) >= min_area)
+
+    # Only the selected latest months are used for the whole output
+    start = window_start(index, month)
+    df = df.slice(start)
+    rows = rows[rows >= start] - start
+
+    if conditions:
+        mask = (
+            df.lazy()
+            .select(pl.all().gather(rows))
+            .select(pl.all_horizontal(conditions).fill_null(False))
+            .collect()
+            .to_series()
+            .to_numpy()
         )
+        rows = rows[mask]
+
+    selected = np.zeros(df.height, dtype=bool)
+    selected[rows] = True
 
-    # Filter and rounding for price and area columns
+    # Filter and rounding for price and area columns. Float32 values are
+    # widened first, so rounded values print without float noise
     price_type = convert_price_area(price_type, area_type)
 
     if area_type == "area_sqft":
         rd_col = [
-            pl.col("price").round(2),
-            pl.col("price_sqft").round(2),
-            pl.col("area_sqft").round(2),
+            pl.col("price").cast(pl.Float64).round(2),
+            pl.col("price_sqft").cast(pl.Float64).round(2),
+            pl.col("area_sqft").cast(pl.Float64).round(2),
         ]
         drop_columns = ["price_sqm", "area_sqm"]
     else:
         rd_col = [
-            pl.col("price").round(2),
-            pl.col("price_sqm").round(2),
-            pl.col("area_sqm").round(2),
+            pl.col("price").cast(pl.Float64).round(2),
+            pl.col("price_sqm").cast(pl.Float64).round(2),
+            pl.col("area_sqm").cast(pl.Float64).round(2),
         ]
         drop_columns = ["price_sqft", "area_sqft"]
 
-    return df.with_columns(rd_col + flags).drop(drop_columns).collect()
+    # Coordinates are for map features, not the table or charts
+    drop_columns += ["LATITUDE", "LONGITUDE"]
 
+    return df.with_columns(rd_col + [pl.Series("selected", selected)]).drop(
+        drop_columns, strict=False
+    )
 
-app.layout = html.Div(
-    [
-        html.Div(
-            id="data-store",
-            style={"display": "none"},
-            children=df.write_json(),
-        ),
-        dcc.Store(id="filtered-data"),
-        html.H3(
-            children="These are Homes, Truly",
-            style={"font-weight": "bold", "font-size": "26px"},
-            className="mb-4 pt-4 px-4",
-        ),
-        dcc.Markdown(
-            """
-        Explore Singapore's most recent past public housing transactions
-        effortlessly with our site! Updated daily with data from data.gov.sg,
-        our tool allows you access to the latest information public housing
-        resale data provided by HDB. Currently, the data is taken as is, and
-        may not reflect the latest public housing transactions reported by the
-        media.
-
-        I built this tool to help anyone who wants to research on the Singapore
-        public housing resale market, whether you're a prospective buyer,
-        seller, or someone just curious about how much your neighbours are
-        selling their public homes! Beyond a table of transactions, I included
-        a scatter plot to compare home prices with price per sq metre / feet
-        and a boxplot distribution of home prices or price per sq metre / feet.
-
-        **This website is best view on a desktop, because doing property
-        research on your phone will be such a pain!**
-
-        *Also, if you are interested general Singapore public housing resale
-        market trends of the past few years, visit my other dashboard @ **Public
-        Home Trends ( Above )**, where I share broader public housing resale 
-        trends, outliers and price category breakdowns.*""",
-            className="px-4",
-        ),
-        dbc.Row(
+
+def split_selected(df: pl.DataFrame):
+    """Split df_filter output into selected and remaining rows in one pass"""
+    if "selected" not in df.columns:
+        return df, df.clear()
+
+    empty = df.drop("selected").clear()
+    parts = df.partition_by("selected", as_dict=True, include_key=False)
+    return parts.get((True,), empty), parts.get((False,), empty)
+
+
+@lru_cache(maxsize=32)
+def cached_query(query: str) -> pl.DataFrame:
+    """Run df_filter for a JSON encoded query, reused by table paging"""
+    return df_filter(**json.loads(query))
+
+
+@lru_cache(maxsize=32)
+def sorted_rows(query: str, sort_model: str) -> pl.DataFrame:
+    """Selected table rows of a query, sorted by an AG Grid sort model"""
+    df, _ = split_selected(cached_query(query))
+
+    # Display columns are built per page, so sort on their typed sources.
+    # Text columns are Enums over sorted labels, so they sort as strings
+    sort_cols = {"lease": pl.col("lease_mths")}
+
+    sort_model = json.loads(sort_model)
+    if sort_model:
+        df = df.sort(
             [
-                dbc.Col(
-                    dbc.Button(
-                        "Filters",
-                        id="collapse-button",
-                        className="mb-3",
-                        color="danger",
-                        n_clicks=0,
-                        style={"verticalAlign": "top"},
-                    ),
-                    width="auto",
-                ),
-                dbc.Col(
-                    dcc.Loading(
-                        [
-                            html.P(
-                                id="dynamic-text",
-                                style={
-                                    "textAlign": "center",
-                                    "padding-top": "10px",
-                                },
-                            )
-                        ],
-                        type="circle",
-                        color="rgb(220, 38, 38)",
-                    ),
-                    width="auto",
-                ),
-                dbc.Col(
-                    dbc.Button(
-                        "Caveats",
-                        id="collapse-caveats",
-                        className="mb-3",
-                        color="danger",
-                        n_clicks=0,
-                        style={"verticalAlign": "top"},
-                    ),
-                    width="auto",
-                ),
+                sort_cols.get(i["colId"], pl.col(i["colId"]))
+                for i in sort_model
             ],
-            justify="center",
-        ),
-        dbc.Collapse(
-            dbc.Card(
-                dbc.CardBody(
-                    [
-                        dcc.Markdown("""
-                1. Area provided by HDB is in square metres. Calculations for
-                square feet are done by taking square metres by 10.7639.
-                2. Lease left is calculated from remaining lease provided by HDB.
-                3. Data is taken from HDB as is. This data source seems
-                slower that transactions reported in the media.
-                4. Information provided here is only for research, and
-                shouldn't be seen as financial advice.""")
-                    ],
-                    style={
-                        "textAlign": "left",
-                        "color": "#555",
-                        "padding": "5px",
-                    },
-                ),
+            descending=[i["sort"] == "desc" for i in sort_model],
+        )
+    return df
+
+
+# Static layout content, shared by every dataset version
+intro_text = """
+Explore Singapore's most recent past public housing transactions
+effortlessly with our site! Updated daily with data from data.gov.sg,
+our tool allows you access to the latest information public housing
+resale data provided by HDB. Currently, the data is taken as is, and may
+not reflect the latest public housing transactions reported by the
+media.
+
+I built this tool to help anyone who wants to research on the Singapore
+public housing resale market, whether you're a prospective buyer,
+seller, or someone just curious about how much your neighbours are
+selling their public homes! Beyond a table of transactions, I included a
+scatter plot to compare home prices with price per sq metre / feet and a
+boxplot distribution of home prices or price per sq metre / feet.
+
+**This website is best view on a desktop, because doing property
+research on your phone will be such a pain!**
+
+*Also, if you are interested general Singapore public housing resale
+market trends of the past few years, visit my other dashboard @ **Public
+Home Trends ( Above )**, where I share broader public housing resale
+trends, outliers and price category breakdowns.*"""
+
+caveat_text = """
+1. Area provided by HDB is in square metres. Calculations for square
+   feet are done by taking square metres by 10.7639.
+2. Lease left is calculated from remaining lease provided by HDB.
+3. Data is taken from HDB as is. This data source seems slower that
+   transactions reported in the media.
+4. Information provided here is only for research, and shouldn't be seen
+   as financial advice."""
+
+area_options = [
+    {"label": "Sq Feet", "value": "area_sqft"},
+    {"label": "Sq M", "value": "area_sqm"},
+]
+price_options = [
+    {"label": "Price", "value": "price"},
+    {"label": "Price / Area", "value": "price_area"},
+]
+table_title = "Filtered Public Housing Transactions"
+table_props = {
+    "rowModelType": "infinite",
+    "className": "ag-theme-balham",
+    "columnSize": "responsiveSizeToFit",
+    "dashGridOptions": {
+        "pagination": True,
+        "paginationAutoPageSize": True,
+        "cacheBlockSize": 100,
+    },
+}
+
+
+def build_layout(version):
+    """Dashboard layout for a published dataset version"""
+    df = get_dataset(version)
+    towns, flat_type_grps, final_flat_type_grps = filter_options(df)
+
+    return html.Div(
+        [
+            dcc.Store(id="data-store", data=version),
+            dcc.Store(id="query-params"),
+            html.Div(id="price-table-refresh", style={"display": "none"}),
+            html.H3(
+                children="These are Homes, Truly",
+                style={"font-weight": "bold", "font-size": "26px"},
+                className="mb-4 pt-4 px-4",
             ),
-            id="caveats",
-            is_open=False,
-        ),
-        dbc.Collapse(
-            dbc.Card(
-                dbc.CardBody(
-                    [
-                        html.Div(
-                            [
-                                html.Div(
-                                    [
-                                        html.Label("Months"),
-                                        dcc.Dropdown(
-                                            options=[3, 6], value=6, id="month"
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "inline-block",
-                                        "width": "7%",
-                                        "padding": "10px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Town"),
-                                        html.Div(
-                                            dcc.Dropdown(
-                                                options=towns,
-                                                value="All",
-                                                id="town",
-                                            )
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "inline-block",
-                                        "width": "18%",
-                                        "padding": "10px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Flat"),
-                                        dcc.Dropdown(
-                                            multi=True,
-                                            options=final_flat_type_grps,
-                                            value=flat_type_grps,
-                                            id="flat",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "inline-block",
-                                        "width": "40%",
-                                        "padding": "10px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Min Lease [Yrs]"),
-                                        dcc.Input(
-                                            type="number",
-                                            placeholder="Add No.",
-                                            style={
-                                                "display": "flex",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            id="min_lease",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "12%",
-                                        "padding": "10px",
-                                        "verticalAlign": "top",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Max Lease [Yrs]"),
-                                        dcc.Input(
-                                            type="number",
-                                            placeholder="Add No.",
-                                            style={
-                                                "display": "flex",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            id="max_lease",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "12%",
-                                        "padding": "10px",
-                                        "verticalAlign": "top",
-                                    },
-                                ),
-                            ],
-                            style={
-                                "display": "flex",
-                                "flexDirection": "row",
-                                "alignItems": "center",
-                            },
-                        ),
-                        # Area inputs
-                        html.Div(
-                            [
-                                html.Div(
-                                    [
-                                        html.Label("Sq Feet | Sq M"),
-                                        html.Div(
-                                            dcc.Dropdown(
-                                                options=[
-                                                    {
-                                                        "label": "Sq Feet",
-                                                        "value": "area_sqft",
-                                                    },
-                                                    {
-                                                        "label": "Sq M",
-                                                        "value": "area_sqm",
-                                                    },
-                                                ],
-                                                value="area_sqft",
-                                                id="area_type",
-                                            )
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "12%",
-                                        "padding": "10px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Min Area"),
-                                        dcc.Input(
-                                            type="number",
-                                            placeholder="Add No.",
-                                            style={
-                                                "display": "inline-block",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            id="min_area",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "12%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Max Area"),
-                                        dcc.Input(
-                                            type="number",
-                                            placeholder="Add No.",
-                                            style={
-                                                "display": "inline-block",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            id="max_area",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "12%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Price | Price / Area"),
-                                        dcc.Dropdown(
-                                            options=[
-                                                {
-                                                    "label": "Price",
-                                                    "value": "price",
-                                                },
-                                                {
-                                                    "label": "Price / Area",
-                                                    "value": "price_area",
-                                                },
-                                            ],
-                                            value="price",
-                                            id="price_type",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "14%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Min Price | Price / Area"),
-                                        dcc.Input(
-                                            type="number",
-                                            placeholder="Add No.",
-                                            style={
-                                                "display": "inline-block",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            id="min_price",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "15%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label("Max Price | Price / Area"),
-                                        dcc.Input(
-                                            type="number",
-                                            style={
-                                                "display": "inline-block",
-                                                "border-color": "#E5E4E2",
-                                                "padding": "5px",
-                                            },
-                                            placeholder="Add No.",
-                                            id="max_price",
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "15%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                                html.Div(
-                                    [
-                                        html.Label(
-                                            "Submit",
-                                            style={"margin-top": "12px"},
-                                        ),
-                                        dbc.Button(
-                                            "Submit",
-                                            id="submit-button",
-                                            className="mb-3",
-                                            color="danger",
-                                            n_clicks=0,
-                                            style={"verticalAlign": "top"},
-                                        ),
-                                    ],
-                                    style={
-                                        "display": "flex",
-                                        "flexDirection": "column",
-                                        "width": "8%",
-                                        "padding": "5px",
-                                    },
-                                ),
-                            ],
-                            style={
-                                "display": "flex",
-                                "flexDirection": "row",
-                                "alignItems": "center",
-                            },
-                        ),
-                        html.Div(
-                            [
-                                html.Label("""Search by Street 
-        ( Add | separator to include >1 street )"""),
-                                dcc.Input(
-                                    type="text",
-                                    style={
-                                        "display": "inline-block",
-                                        "border-color": "#E5E4E2",
-                                        "padding": "5px",
-                                    },
-                                    placeholder="Type the Street Name here",
-                                    id="street",
-                                ),
-                            ],
-                            style={
-                                "display": "flex",
-                                "flexDirection": "column",
-                                "width": "45%",
-                                "padding": "5px",
-                            },
-                        ),
-                    ]
-                )
+            dcc.Markdown(
+                intro_text,
+                className="px-4",
             ),
-            id="collapse",
-            is_open=True,
-        ),
-        # Text box to display dynamic content
-        html.Div(
-            [
-                html.Div(
-                    [
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Button(
+                            "Filters",
+                            id="collapse-button",
+                            className="mb-3",
+                            color="danger",
+                            n_clicks=0,
+                            style={"verticalAlign": "top"},
+                        ),
+                        width="auto",
+                    ),
+                    dbc.Col(
                         dcc.Loading(
                             [
-                                html.Div(
-                                    [
-                                        html.H3(
-                                            "Filtered Public Housing Transactions",
-                                            style={
-                                                "font-size": "20px",
-                                                "textAlign": "left",
-                                                "margin-top": "15px",
-                                                "margin-bottom": "5px",
-                                            },
-                                        ),
-                                        dag.AgGrid(
-                                            id="price-table",
-                                            columnDefs=grid_format(df),
-                                            rowData=df.to_dicts(),
-                                            className="ag-theme-balham",
-                                            columnSize="responsiveSizeToFit",
-                                            dashGridOptions={
-                                                "pagination": True,
-                                                "paginationAutoPageSize": True,
-                                            },
-                                        ),
-                                    ],
+                                html.P(
+                                    id="dynamic-text",
                                     style={
-                                        "height": 450,
-                                        "width": 1200,
-                                        "display": "inline-block",
+                                        "textAlign": "center",
+                                        "padding-top": "10px",
                                     },
                                 )
                             ],
                             type="circle",
                             color="rgb(220, 38, 38)",
                         ),
-                    ],
-                    style=dict(display="flex"),
+                        width="auto",
+                    ),
+                    dbc.Col(
+                        dbc.Button(
+                            "Caveats",
+                            id="collapse-caveats",
+                            className="mb-3",
+                            color="danger",
+                            n_clicks=0,
+                            style={"verticalAlign": "top"},
+                        ),
+                        width="auto",
+                    ),
+                ],
+                justify="center",
+            ),
+            dbc.Collapse(
+                dbc.Card(
+                    dbc.CardBody(
+                        [dcc.Markdown(caveat_text)],
+                        style={
+                            "textAlign": "left",
+                            "color": "#555",
+                            "padding": "5px",
+                        },
+                    ),
                 ),
-                dcc.Loading(
-                    [
-                        html.Div(
-                            [
-                                dcc.Graph(
-                                    id="g0",
-                                    style={
-                                        "display": "inline-block",
-                                        "width": "48%",
-                                    },
-                                ),
-                                dcc.Graph(
-                                    id="g2",
-                                    style={
-                                        "display": "inline-block",
-                                        "width": "38%",
-                                    },
-                                ),
-                            ],
-                            style={
-                                "display": "flex",
-                                "justify-content": "flex-start",
-                                "width": "100%",
-                            },
-                        )
-                    ],
-                    type="circle",
-                    color="rgb(220, 38, 38)",
+                id="caveats",
+                is_open=False,
+            ),
+            dbc.Collapse(
+                dbc.Card(
+                    dbc.CardBody(
+                        [
+                            html.Div(
+                                [
+                                    html.Div(
+                                        [
+                                            html.Label("Months"),
+                                            dcc.Dropdown(
+                                                options=[3, 6],
+                                                value=6,
+                                                id="month",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "inline-block",
+                                            "width": "7%",
+                                            "padding": "10px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Town"),
+                                            html.Div(
+                                                dcc.Dropdown(
+                                                    options=towns,
+                                                    value="All",
+                                                    id="town",
+                                                )
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "inline-block",
+                                            "width": "18%",
+                                            "padding": "10px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Flat"),
+                                            dcc.Dropdown(
+                                                multi=True,
+                                                options=final_flat_type_grps,
+                                                value=flat_type_grps,
+                                                id="flat",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "inline-block",
+                                            "width": "40%",
+                                            "padding": "10px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Min Lease [Yrs]"),
+                                            dcc.Input(
+                                                type="number",
+                                                placeholder="Add No.",
+                                                style={
+                                                    "display": "flex",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                id="min_lease",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "12%",
+                                            "padding": "10px",
+                                            "verticalAlign": "top",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Max Lease [Yrs]"),
+                                            dcc.Input(
+                                                type="number",
+                                                placeholder="Add No.",
+                                                style={
+                                                    "display": "flex",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                id="max_lease",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "12%",
+                                            "padding": "10px",
+                                            "verticalAlign": "top",
+                                        },
+                                    ),
+                                ],
+                                style={
+                                    "display": "flex",
+                                    "flexDirection": "row",
+                                    "alignItems": "center",
+                                },
+                            ),
+                            # Area inputs
+                            html.Div(
+                                [
+                                    html.Div(
+                                        [
+                                            html.Label("Sq Feet | Sq M"),
+                                            html.Div(
+                                                dcc.Dropdown(
+                                                    options=area_options,
+                                                    value="area_sqft",
+                                                    id="area_type",
+                                                )
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "12%",
+                                            "padding": "10px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Min Area"),
+                                            dcc.Input(
+                                                type="number",
+                                                placeholder="Add No.",
+                                                style={
+                                                    "display": "inline-block",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                id="min_area",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "12%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Max Area"),
+                                            dcc.Input(
+                                                type="number",
+                                                placeholder="Add No.",
+                                                style={
+                                                    "display": "inline-block",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                id="max_area",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "12%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label("Price | Price / Area"),
+                                            dcc.Dropdown(
+                                                options=price_options,
+                                                value="price",
+                                                id="price_type",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "14%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label(
+                                                "Min Price | Price / Area"
+                                            ),
+                                            dcc.Input(
+                                                type="number",
+                                                placeholder="Add No.",
+                                                style={
+                                                    "display": "inline-block",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                id="min_price",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "15%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label(
+                                                "Max Price | Price / Area"
+                                            ),
+                                            dcc.Input(
+                                                type="number",
+                                                style={
+                                                    "display": "inline-block",
+                                                    "border-color": "#E5E4E2",
+                                                    "padding": "5px",
+                                                },
+                                                placeholder="Add No.",
+                                                id="max_price",
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "15%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Label(
+                                                "Submit",
+                                                style={"margin-top": "12px"},
+                                            ),
+                                            dbc.Button(
+                                                "Submit",
+                                                id="submit-button",
+                                                className="mb-3",
+                                                color="danger",
+                                                n_clicks=0,
+                                                style={"verticalAlign": "top"},
+                                            ),
+                                        ],
+                                        style={
+                                            "display": "flex",
+                                            "flexDirection": "column",
+                                            "width": "8%",
+                                            "padding": "5px",
+                                        },
+                                    ),
+                                ],
+                                style={
+                                    "display": "flex",
+                                    "flexDirection": "row",
+                                    "alignItems": "center",
+                                },
+                            ),
+                            html.Div(
+                                [
+                                    html.Label("""Search by Street 
+            ( Add | separator to include >1 street )"""),
+                                    dcc.Input(
+                                        type="text",
+                                        style={
+                                            "display": "inline-block",
+                                            "border-color": "#E5E4E2",
+                                            "padding": "5px",
+                                        },
+                                        placeholder=(
+                                            "Type the Street Name here"
+                                        ),
+                                        id="street",
+                                        list="street-suggestions",
+                                    ),
+                                    html.Datalist(id="street-suggestions"),
+                                ],
+                                style={
+                                    "display": "flex",
+                                    "flexDirection": "column",
+                                    "width": "45%",
+                                    "padding": "5px",
+                                },
+                            ),
+                        ]
+                    )
                 ),
-            ],
-            style={
-                "display": "flex",
-                "flexDirection": "column",
-                "justifyContent": "center",
-                "alignItems": "center",
-                "minHeight": "100vh",
-                "textAlign": "center",
-            },
+                id="collapse",
+                is_open=True,
+            ),
+            # Text box to display dynamic content
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            dcc.Loading(
+                                [
+                                    html.Div(
+                                        [
+                                            html.H3(
+                                                table_title,
+                                                style={
+                                                    "font-size": "20px",
+                                                    "textAlign": "left",
+                                                    "margin-top": "15px",
+                                                    "margin-bottom": "5px",
+                                                },
+                                            ),
+                                            dag.AgGrid(
+                                                id="price-table",
+                                                columnDefs=grid_format(df),
+                                                **table_props,
+                                            ),
+                                        ],
+                                        style={
+                                            "height": 450,
+                                            "width": 1200,
+                                            "display": "inline-block",
+                                        },
+                                    )
+                                ],
+                                type="circle",
+                                color="rgb(220, 38, 38)",
+                            ),
+                        ],
+                        style=dict(display="flex"),
+                    ),
+                    dcc.Loading(
+                        [
+                            html.Div(
+                                [
+                                    dcc.Graph(
+                                        id="g0",
+                                        style={
+                                            "display": "inline-block",
+                                            "width": "48%",
+                                        },
+                                    ),
+                                    dcc.Graph(
+                                        id="g2",
+                                        style={
+                                            "display": "inline-block",
+                                            "width": "38%",
+                                        },
+                                    ),
+                                ],
+                                style={
+                                    "display": "flex",
+                                    "justify-content": "flex-start",
+                                    "width": "100%",
+                                },
+                            )
+                        ],
+                        type="circle",
+                        color="rgb(220, 38, 38)",
+                    ),
+                ],
+                style={
+                    "display": "flex",
+                    "flexDirection": "column",
+                    "justifyContent": "center",
+                    "alignItems": "center",
+                    "minHeight": "100vh",
+                    "textAlign": "center",
+                },
+            ),
+        ]
+    )
+
+
+loading_layout = html.Div(
+    [
+        html.H3(
+            children="Loading the latest transactions from data.gov.sg ...",
+            style={"font-weight": "bold", "font-size": "20px"},
+            className="mb-4 pt-4 px-4",
         ),
+        dcc.Interval(id="loading-poll", interval=3000),
+        dcc.Store(id="loading-ready"),
     ]
 )
 
 
+def serve_layout():
+    """Serve a loading page until the dataset is ready"""
+    if not data_ready.is_set():
+        return loading_layout
+    return build_layout(snapshot["version"])
+
+
+app.layout = serve_layout
+
+
+@callback(
+    Output("loading-ready", "data"),
+    Input("loading-poll", "n_intervals"),
+    prevent_initial_call=True,
+)
+def check_ready(n):
+    return data_ready.is_set() or no_update
+
+
+# Reload the page into the full dashboard once data is ready
+clientside_callback(
+    """
+    function(ready) {
+        if (ready) {
+            window.location.reload();
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("loading-poll", "disabled"),
+    Input("loading-ready", "data"),
+    prevent_initial_call=True,
+)
+
+
 # Standardised Dash Input-Output states
 basic_state = [
     State("town", "value"),
@@ -868,17 +1029,17 @@ added_state = [
     State("max_price", "value"),
     State("min_price", "value"),
     State("street", "value"),
-    State("data-store", "children"),
+    State("data-store", "data"),
 ]
 full_state = basic_state + added_state
 
 
 @callback(
-    Output("filtered-data", "data"),
+    Output("query-params", "data"),
     Input("submit-button", "n_clicks"),
     full_state,
 )
-def filtered_data(
+def build_query(
     n_clicks,
     town,
     area_type,
@@ -892,60 +1053,108 @@ def filtered_data(
     max_price,
     min_price,
     street,
-    data_json,
+    version,
 ):
-    return df_filter(
-        month,
-        town,
-        flat,
-        area_type,
-        max_area,
-        min_area,
-        price_type,
-        max_price,
-        min_price,
-        max_lease,
-        min_lease,
-        street,
-        selected_mths,
-        data_json,
-    ).to_dicts()
+    """Submitted filters as a query, which the server filters by"""
+    query = json.dumps(
+        {
+            "month": month,
+            "town": town,
+            "flat": flat,
+            "area_type": area_type,
+            "max_area": max_area,
+            "min_area": min_area,
+            "price_type": price_type,
+            "max_price": max_price,
+            "min_price": min_price,
+            "max_lease": max_lease,
+            "min_lease": min_lease,
+            "street": street,
+            "version": version,
+        },
+        sort_keys=True,
+    )
+
+    return query
 
 
 @callback(
-    Output("price-table", "rowData"),
-    Output("price-table", "columnDefs"),
-    Input("filtered-data", "data"),
-    State("area_type", "value"),
-    State("price_type", "value"),
+    Output("street-suggestions", "children"),
+    Input("street", "value"),
+    State("data-store", "data"),
+    prevent_initial_call=True,
 )
-def update_table(data, area_type, price_type):
-    """Table output to show all searched transactions"""
-    output = [{}]
-    df = pl.DataFrame(data).drop("year_count")
-    if df is not None:
-        flags = [i for i in df.columns if "flag" in i]
-        for flag in flags:
-            df = df.filter(pl.col(flag))
-        df = df.drop(flags)
-        output = df.to_dicts()
-        columnDefs = grid_format(df)
-    return output, columnDefs
+def street_suggestions(street, version):
+    """Type-ahead addresses for the street being typed"""
+    if not street:
+        return []
+
+    # Earlier | separated streets are kept in front of each suggestion
+    prefix = street.rsplit("|", 1)[0] + "|" if "|" in street else ""
+    index = get_index(version)["street"]
+    return [
+        html.Option(value=prefix + i)
+        for i in dp.suggest_streets(index, street)
+    ]
+
+
+def build_table(df):
+    """Table columns for searched transactions, rows are served by page"""
+    return grid_format(df)
+
+
+def display_rows(df: pl.DataFrame) -> list:
+    """Format a page of typed rows into table display values"""
+    return (
+        df.with_columns(
+            pl.col("month").dt.strftime("%Y-%m"),
+            pl.format(
+                "{}y {}m",
+                pl.col("lease_mths") // 12,
+                (pl.col("lease_mths") % 12).cast(pl.String).str.zfill(2),
+            ).alias("lease"),
+        )
+        .drop("lease_mths", "year_count")
+        .to_dicts()
+    )
 
 
 @callback(
-    Output("dynamic-text", "children"),
-    Input("filtered-data", "data"),
-    basic_state,
+    Output("price-table", "getRowsResponse"),
+    Input("price-table", "getRowsRequest"),
+    State("query-params", "data"),
 )
-def update_text(data, town, area_type, price_type, max_lease, min_lease):
-    """Summary text for searched output"""
+def table_rows(request, query):
+    """Serve a block of sorted table rows for the infinite row model"""
+    if request is None or query is None:
+        return no_update
+
+    df = sorted_rows(query, json.dumps(request.get("sortModel") or []))
+    start, end = request["startRow"], request["endRow"]
+    return {
+        "rowData": display_rows(df.slice(start, end - start)),
+        "rowCount": df.height,
+    }
 
-    df = pl.DataFrame(data)
-    flags = [i for i in df.columns if "flag" in i]
-    for flag in flags:
-        df = df.filter(pl.col(flag))
-    df = df.drop(flags)
+
+# Refetch visible table rows whenever a new search is submitted
+clientside_callback(
+    """
+    function(query) {
+        dash_ag_grid.getApiAsync("price-table").then(
+            (api) => api.purgeInfiniteCache()
+        );
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("price-table-refresh", "children"),
+    Input("query-params", "data"),
+    prevent_initial_call=True,
+)
+
+
+def build_text(df, town, area_type, price_type, max_lease, min_lease):
+    """Summary text for searched output"""
 
     text = "<b><< YOUR SEARCH HAS NO RESULTS >></b>"
     records = df.shape[0]
@@ -983,147 +1192,157 @@ def update_text(data, town, area_type, price_type, max_lease, min_lease):
     return dcc.Markdown(text, dangerously_allow_html=True)
 
 
-@callback(Output("g0", "figure"), Input("filtered-data", "data"), basic_state)
-def update_g0(data, town, area_type, price_type, max_lease, min_lease):
+def build_g0(df, non_df, area_type, price_type):
     """Scatter Plot of Price to Price / Sq Area"""
     fig = go.Figure()
-    df = pl.DataFrame(data)
-
-    if df is not None:
-        flags = [i for i in df.columns if "flag" in i]
-
-        non_df = pl.DataFrame()
-        for flag in flags:
-            non_df = pl.concat([non_df, df.filter(~pl.col(flag))])
-
-        for flag in flags:
-            df = df.filter(pl.col(flag))
-        df = df.drop(flags)
-
-        price_type = convert_price_area(price_type, area_type)
-        price_label = "price_sqm" if area_type == "area_sqm" else "price_sqft"
-
-        base_cols = ["year_count", "town", "street", area_type]
-        customdata_set = list(df[base_cols].to_numpy())
 
-        fig.add_trace(
-            go.Scattergl(
-                y=non_df.select("price").to_series(),
-                x=non_df.select(price_label).to_series(),
-                mode="markers",
-                hoverinfo="skip",
-                marker={"color": "#FFC0BD", "opacity": 0.5},
-                name="Rest of SG",
-            )
-        )
-        fig.add_trace(
-            go.Scattergl(
-                y=df.select("price").to_series(),
-                x=df.select(price_label).to_series(),
-                customdata=customdata_set,
-                hovertemplate="<i>Price:</i> %{y:$,}<br>"
-                + "<i>Area:</i> %{customdata[3]:,}<br>"
-                + "<i>Price/Area:</i> %{x:$,}<br>"
-                + "<i>Town :</i> %{customdata[1]}<br>"
-                + "<i>Street Name:</i> %{customdata[2]}<br>"
-                + "<i>Lease Left:</i> %{customdata[0]}",
-                mode="markers",
-                marker={"color": "rgb(220, 38, 38)", "opacity": 0.9},
-                name="Selected Data",
-            )
+    price_type = convert_price_area(price_type, area_type)
+    price_label = "price_sqm" if area_type == "area_sqm" else "price_sqft"
+
+    base_cols = ["year_count", "town", "street", area_type]
+    customdata_set = list(df[base_cols].to_numpy())
+
+    fig.add_trace(
+        go.Scattergl(
+            y=non_df.select("price").to_series(),
+            x=non_df.select(price_label).to_series(),
+            mode="markers",
+            hoverinfo="skip",
+            marker={"color": "#FFC0BD", "opacity": 0.5},
+            name="Rest of SG",
         )
-        fig.update_layout(
-            title="<b>Home Prices vs Price / Area<b>",
-            yaxis={
-                "title": "price",
-                "gridcolor": "#d3d3d3",
-                "showspikes": True,
-            },
-            xaxis={
-                "title": f"{price_label}",
-                "gridcolor": "#d3d3d3",
-                "showspikes": True,
-            },
-            width=chart_width,
-            height=chart_height,
-            legend=legend,
-            plot_bgcolor="white",
-            margin=dict(l=5, r=5),
+    )
+    fig.add_trace(
+        go.Scattergl(
+            y=df.select("price").to_series(),
+            x=df.select(price_label).to_series(),
+            customdata=customdata_set,
+            hovertemplate="<i>Price:</i> %{y:$,}<br>"
+            + "<i>Area:</i> %{customdata[3]:,}<br>"
+            + "<i>Price/Area:</i> %{x:$,}<br>"
+            + "<i>Town :</i> %{customdata[1]}<br>"
+            + "<i>Street Name:</i> %{customdata[2]}<br>"
+            + "<i>Lease Left:</i> %{customdata[0]}",
+            mode="markers",
+            marker={"color": "rgb(220, 38, 38)", "opacity": 0.9},
+            name="Selected Data",
         )
+    )
+    fig.update_layout(
+        title="<b>Home Prices vs Price / Area<b>",
+        yaxis={
+            "title": "price",
+            "gridcolor": "#d3d3d3",
+            "showspikes": True,
+        },
+        xaxis={
+            "title": f"{price_label}",
+            "gridcolor": "#d3d3d3",
+            "showspikes": True,
+        },
+        width=chart_width,
+        height=chart_height,
+        legend=legend,
+        plot_bgcolor="white",
+        margin=dict(l=5, r=5),
+    )
     return fig
 
 
-@callback(Output("g2", "figure"), Input("filtered-data", "data"), basic_state)
-def update_g2(data, town, area_type, price_type, max_lease, min_lease):
+def build_g2(df, non_df, area_type, price_type):
     """Price to Lease Left Plot"""
     fig = go.Figure()
-    df = pl.DataFrame(data)
-
-    if df is not None:
-        flags = [i for i in df.columns if "flag" in i]
-        non_df = pl.DataFrame()
-        for flag in flags:
-            non_df = pl.concat([non_df, df.filter(~pl.col(flag))])
-
-        for flag in flags:
-            df = df.filter(pl.col(flag))
-        df = df.drop(flags)
-
-        # Transform user inputs into table usable columns
-        price_type = convert_price_area(price_type, area_type)
-
-        price_label = "price_sqm" if area_type == "area_sqm" else "price_sqft"
-        base_cols = ["price", price_label, "town", "street", area_type]
-        customdata_set = list(df[base_cols].to_numpy())
-
-        fig.add_trace(
-            go.Scattergl(
-                y=non_df.select(price_type).to_series(),  # unchanged
-                x=non_df.select("year_count").to_series(),
-                mode="markers",
-                hoverinfo="skip",
-                marker={"color": "#FFC0BD", "opacity": 0.5},
-                name="Rest of SG",
-            )
-        )
 
-        fig.add_trace(
-            go.Scattergl(
-                y=df.select(price_type).to_series(),  # unchanged
-                x=df.select("year_count").to_series(),
-                customdata=customdata_set,
-                hovertemplate="<i>Price:</i> %{customdata[0]:$,}<br>"
-                + "<i>Area:</i> %{customdata[4]:,}<br>"
-                + "<i>Price/Area:</i> %{customdata[1]:$,}<br>"
-                + "<i>Town :</i> %{customdata[2]}<br>"
-                + "<i>Street Name:</i> %{customdata[3]}<br>"
-                + "<i>Lease Left:</i> %{x}",
-                mode="markers",
-                marker={"color": "rgb(220, 38, 38)", "opacity": 0.9},
-                name="Selected Data",
-            )
+    # Transform user inputs into table usable columns
+    price_type = convert_price_area(price_type, area_type)
+
+    price_label = "price_sqm" if area_type == "area_sqm" else "price_sqft"
+    base_cols = ["price", price_label, "town", "street", area_type]
+    customdata_set = list(df[base_cols].to_numpy())
+
+    fig.add_trace(
+        go.Scattergl(
+            y=non_df.select(price_type).to_series(),  # unchanged
+            x=non_df.select("year_count").to_series(),
+            mode="markers",
+            hoverinfo="skip",
+            marker={"color": "#FFC0BD", "opacity": 0.5},
+            name="Rest of SG",
         )
-        fig.update_layout(
-            title="<b>Home Prices vs Lease Left<b>",
-            yaxis={
-                "title": f"{price_type}",
-                "gridcolor": "#d3d3d3",
-                "showspikes": True,
-            },
-            xaxis={
-                "title": "lease",
-                "gridcolor": "#d3d3d3",
-                "showspikes": True,
-            },
-            width=chart_width,
-            height=chart_height,
-            legend=legend,
-            plot_bgcolor="white",
-            margin=dict(l=5, r=5),
+    )
+
+    fig.add_trace(
+        go.Scattergl(
+            y=df.select(price_type).to_series(),  # unchanged
+            x=df.select("year_count").to_series(),
+            customdata=customdata_set,
+            hovertemplate="<i>Price:</i> %{customdata[0]:$,}<br>"
+            + "<i>Area:</i> %{customdata[4]:,}<br>"
+            + "<i>Price/Area:</i> %{customdata[1]:$,}<br>"
+            + "<i>Town :</i> %{customdata[2]}<br>"
+            + "<i>Street Name:</i> %{customdata[3]}<br>"
+            + "<i>Lease Left:</i> %{x}",
+            mode="markers",
+            marker={"color": "rgb(220, 38, 38)", "opacity": 0.9},
+            name="Selected Data",
         )
+    )
+    fig.update_layout(
+        title="<b>Home Prices vs Lease Left<b>",
+        yaxis={
+            "title": f"{price_type}",
+            "gridcolor": "#d3d3d3",
+            "showspikes": True,
+        },
+        xaxis={
+            "title": "lease",
+            "gridcolor": "#d3d3d3",
+            "showspikes": True,
+        },
+        width=chart_width,
+        height=chart_height,
+        legend=legend,
+        plot_bgcolor="white",
+        margin=dict(l=5, r=5),
+    )
     return fig
 
 
+@callback(
+    Output("price-table", "columnDefs"),
+    Output("dynamic-text", "children"),
+    Output("g0", "figure"),
+    Output("g2", "figure"),
+    Input("query-params", "data"),
+    basic_state,
+)
+def update_dashboard(query, town, area_type, price_type, max_lease, min_lease):
+    """Filter and split data once on the server, then build all outputs"""
+    if query is None:
+        return no_update
+
+    timings = {}
+    with stage_timer(timings, "filter"):
+        df, non_df = split_selected(cached_query(query))
+
+    with stage_timer(timings, "table"):
+        column_defs = build_table(df)
+
+    with stage_timer(timings, "text"):
+        text = build_text(
+            df, town, area_type, price_type, max_lease, min_lease
+        )
+
+    with stage_timer(timings, "g0"):
+        g0 = build_g0(df, non_df, area_type, price_type)
+
+    with stage_timer(timings, "g2"):
+        g2 = build_g2(df, non_df, area_type, price_type)
+
+    print(f"Dashboard stage timings (ms): {timings}")
+    return column_defs, text, g0, g2
+
+
 @callback(
     Output("collapse", "is_open"),
     [Input("collapse-button", "n_clicks")],
@@ -1143,4 +1362,5 @@ def toggle_caveat(n, is_open):
 
 
 if __name__ == "__main__":
+    load_data()
     app.run_server(debug=True)
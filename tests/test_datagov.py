@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils import datagov as dg
+
+
+class StubDataGov(BaseHTTPRequestHandler):
+    """ datastore_search stand-in, capping pages at page_cap rows """
+
+    total = 25000
+    available = 25000
+    page_cap = 1000
+    fail_first = 0
+    calls = []
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        offset = int(params["offset"][0])
+        limit = int(params["limit"][0])
+        self.calls.append(offset)
+
+        if len(self.calls) <= self.fail_first:
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        end = min(offset + limit, offset + self.page_cap, self.available)
+        records = [
+            {col: str(i) for col in dg.df_cols} for i in range(offset, end)
+        ]
+        body = json.dumps(
+            {"result": {"records": records, "total": self.total}}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    """ Serve StubDataGov locally, and point the module client at it """
+    handler = type("Handler", (StubDataGov,), {"calls": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{server.server_port}/datastore_search"
+    monkeypatch.setattr(dg, "client", dg.DataGovClient(url, backoff=0))
+    monkeypatch.setattr(dg, "cache_dir", str(tmp_path))
+    yield handler
+    server.shutdown()
+
+
+def test_pages_past_server_cap(stub):
+    records, total = dg.client.fetch_records({"month": "2024-01"})
+
+    assert total == 25000
+    assert len(records) == 25000
+    assert records[-1]["month"] == "24999"
+    assert stub.calls[:3] == [0, 1000, 2000]
+
+
+def test_retries_rate_limited_requests(stub):
+    stub.fail_first = 2
+    stub.total = stub.available = 1500
+
+    records, _ = dg.client.fetch_records({"month": "2024-01"})
+
+    assert len(records) == 1500
+    assert stub.calls[:3] == [0, 0, 0]
+
+
+def test_truncated_pull_is_not_cached(stub):
+    stub.available = 5000
+
+    df, complete = dg.fetch_hdb_data("2024-01")
+    assert df.height == 5000
+    assert not complete
+
+    df = dg.load_hdb_month("2024-01")
+    assert df.height == 5000
+    assert not os.path.exists(dg.cache_path("2024-01"))
@@ -0,0 +1,83 @@
+import bson
+import polars as pl
+import pytest
+from pymongo.errors import PyMongoError
+
+from utils import mongo_data as mdb
+
+
+class FakeCollection:
+    """ Collection stand-in, serving find_raw_batches from a list of docs
+    and recording every query it receives
+    """
+
+    def __init__(self, docs: list):
+        self.docs = docs
+        self.queries = []
+        self.fail = False
+
+    def find_raw_batches(self, query, projection, batch_size):
+        self.queries.append(query)
+        if self.fail:
+            raise PyMongoError("unreachable")
+
+        month = query.get("month", {})
+        docs = [
+            {k: v for k, v in doc.items() if projection.get(k)}
+            for doc in self.docs
+            if doc["month"] >= month.get("$gte", "")
+        ]
+        return [
+            b"".join(bson.encode(doc) for doc in docs[i:i + batch_size])
+            for i in range(0, len(docs), batch_size)
+        ]
+
+
+def docs_for(months: dict) -> list:
+    return [
+        {"_id": f"{month}-{i}", "month": month, "town": "BEDOK",
+         "resale_price": 500000 + i}
+        for month, count in months.items()
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "hdb_hist_v2.parquet")
+
+
+def test_first_load_reads_everything(path):
+    collection = FakeCollection(docs_for({"2024-01": 3, "2024-02": 2}))
+
+    df = mdb.load_history(collection, path)
+
+    assert df.height == 5
+    assert df.columns == mdb.hist_cols
+    assert "$gte" not in collection.queries[0]["month"]
+    assert pl.read_parquet(path).height == 5
+
+
+def test_incremental_load_rereads_last_month(path):
+    collection = FakeCollection(docs_for({"2024-01": 3, "2024-02": 2}))
+    mdb.load_history(collection, path)
+
+    # 2024-02 gained a row and 2024-03 is new, while older months are kept
+    # from the snapshot even if MongoDB no longer holds them
+    collection.docs = docs_for({"2024-02": 3, "2024-03": 4})
+    df = mdb.load_history(collection, path)
+
+    assert collection.queries[-1]["month"]["$gte"] == "2024-02"
+    counts = dict(df.group_by("month").len().iter_rows())
+    assert counts == {"2024-01": 3, "2024-02": 3, "2024-03": 4}
+
+
+def test_falls_back_to_snapshot_on_error(path):
+    collection = FakeCollection(docs_for({"2024-01": 3}))
+    mdb.load_history(collection, path)
+
+    collection.fail = True
+    assert mdb.load_history(collection, path).height == 3
+
+    with pytest.raises(PyMongoError):
+        mdb.load_history(collection, path + ".missing")
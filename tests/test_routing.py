@@ -0,0 +1,71 @@
+import polars as pl
+import pytest
+
+from utils import routing as rt
+
+
+class CountingEngine(rt.StraightLineEngine):
+    """ Straight line engine recording every destination it computes"""
+
+    def __init__(self):
+        self.calls = []
+
+    def routes(self, origin, dests):
+        self.calls.append(list(dests))
+        return super().routes(origin, dests)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "routes.sqlite")
+
+
+def test_miss_is_computed_once(path):
+    origin, dest = (1.3521, 103.8198), (1.3000, 103.8000)
+    engine = CountingEngine()
+    router = rt.Router(engine, path=path)
+
+    route = router.route(origin, dest)
+    assert router.route(origin, dest) == route
+    assert len(engine.calls) == 1
+
+    # A fresh router starts with an empty memory and reads from SQLite
+    fresh_engine = CountingEngine()
+    fresh = rt.Router(fresh_engine, path=path)
+    positions, metres = fresh.route(origin, dest)
+    assert fresh_engine.calls == []
+    assert positions == route[0]
+    assert metres == pytest.approx(route[1])
+
+
+def test_batch_only_computes_missing_routes(path):
+    origin = (1.3521, 103.8198)
+    dests = [(1.30, 103.80), (1.31, 103.81), (1.30, 103.80)]
+    engine = CountingEngine()
+    router = rt.Router(engine, path=path)
+
+    router.route(origin, dests[0])
+    assert len(router.routes(origin, dests)) == 3
+    assert engine.calls == [[dests[0]], [dests[1]]]
+
+
+def test_graph_engine_falls_back_for_unreachable():
+    # Nodes 0-1-2 are connected, node 3 is an island
+    nodes = pl.DataFrame(
+        {
+            "LATITUDE": [1.300, 1.301, 1.302, 1.350],
+            "LONGITUDE": [103.800, 103.800, 103.800, 103.900],
+        }
+    )
+    engine = rt.GraphEngine(nodes, [(0, 1, 111.0), (1, 2, 111.0)])
+    origin = (1.300, 103.800)
+
+    (reached, metres), (island, island_metres) = engine.routes(
+        origin, [(1.302, 103.800), (1.350, 103.900)]
+    )
+    assert len(reached) == 5
+    assert metres == pytest.approx(222.0, abs=1)
+
+    straight = rt.StraightLineEngine().routes(origin, [(1.350, 103.900)])[0]
+    assert island == straight[0]
+    assert island_metres == pytest.approx(straight[1])
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+import polars as pl
+import pytest
+
+from utils import data_process as dp
+from utils.spatial import SpatialIndex
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return pl.DataFrame(
+        {
+            "id": np.arange(2000),
+            "LATITUDE": rng.uniform(1.25, 1.45, 2000),
+            "LONGITUDE": rng.uniform(103.65, 104.0, 2000),
+        }
+    )
+
+
+def brute_force(points, loc_ll):
+    dist = dp.haversine(
+        points["LATITUDE"].to_numpy(), points["LONGITUDE"].to_numpy(), loc_ll
+    )
+    return points.with_columns(pl.Series("dist", dist)).sort("dist")
+
+
+@pytest.mark.parametrize("radius", [100, 800, 3000])
+def test_within_matches_brute_force(points, radius):
+    index = SpatialIndex(points, cell_size=500)
+    rng = np.random.default_rng(1)
+    for loc_ll in zip(rng.uniform(1.2, 1.5, 20), rng.uniform(103.6, 104, 20)):
+        expected = brute_force(points, loc_ll).filter(pl.col("dist") <= radius)
+        result = index.within(loc_ll, radius)
+
+        assert set(result["id"]) == set(expected["id"])
+        assert np.all(np.diff(result["dist"].to_numpy()) >= 0)
+
+
+@pytest.mark.parametrize("k", [1, 5, 40])
+def test_nearest_matches_brute_force(points, k):
+    index = SpatialIndex(points, cell_size=500)
+    rng = np.random.default_rng(2)
+    for loc_ll in zip(rng.uniform(1.2, 1.5, 20), rng.uniform(103.6, 104, 20)):
+        expected = brute_force(points, loc_ll).head(k)
+        result = index.nearest(loc_ll, k=k)
+
+        assert result.height == k
+        np.testing.assert_allclose(result["dist"], expected["dist"])
+
+
+@pytest.mark.parametrize("loc_ll", [(1.9, 104.9), (40.0, -74.0)])
+def test_far_query_returns_quickly(points, loc_ll):
+    index = SpatialIndex(points, cell_size=100)
+
+    start = time.perf_counter()
+    nearest = index.nearest(loc_ll, k=3)
+    within = index.within(loc_ll, 1000)
+    assert time.perf_counter() - start < 1
+
+    expected = brute_force(points, loc_ll).head(3)
+    assert nearest["id"].to_list() == expected["id"].to_list()
+    assert within.height == 0
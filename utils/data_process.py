@@ -1,5 +1,13 @@
-import geopy.distance
+import os
+import threading
+import numpy as np
 import polars as pl
+from contextlib import contextmanager
+
+# Mean earth radius in metres, and the most that haversine distances can
+# differ from geodesic distances on the WGS84 ellipsoid
+earth_radius = 6371008.8
+haversine_tolerance = 0.005
 
 
 def create_mdb_query_w_df_cols(df: pl.DataFrame):
@@ -25,25 +33,210 @@ def create_mdb_query_w_df_cols(df: pl.DataFrame):
     return col_dict, col_filter
 
 
+@contextmanager
+def atomic_write(path: str):
+    """ Yield a temporary path to write to, which is then moved onto path
+    in one step, so readers never see a partially written file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def haversine(lat, lon, loc_ll: tuple) -> np.ndarray:
+    """ Great circle distances in metres from arrays of Lat-Longs to a
+    Lat-Long point, computed for all rows at once
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(loc_ll[0]), np.radians(loc_ll[1])
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * earth_radius * np.arcsin(np.sqrt(a))
+
+
 def table_select_from_pt(df: pl.DataFrame,
                          loc_ll: tuple,
                          select=True,
-                         radius=1000) -> pl.DataFrame:
+                         radius=1000,
+                         exact=False) -> pl.DataFrame:
     """ Takes a Tuple Lat-Long input, a set of tables with Lat-Longs,
     and filters for records that are included or excluded by a radius
-    distance
+    distance. With exact, rows near the radius use geodesic distances
+    """
+    lat = df['LATITUDE'].cast(pl.Float64).to_numpy()
+    lon = df['LONGITUDE'].cast(pl.Float64).to_numpy()
+    dist = haversine(lat, lon, loc_ll)
+
+    # Only rows close to the radius can change sides, so only those pay
+    # for the slower geodesic distance
+    if exact:
+        import geopy.distance
+
+        near = np.flatnonzero(
+            np.abs(dist - radius) <= radius * haversine_tolerance)
+        dist[near] = [
+            geopy.distance.geodesic((lat[i], lon[i]), loc_ll).m
+            for i in near]
+
+    keep = dist <= radius if select else dist > radius
+    return df.with_columns(pl.Series('dist', dist)).filter(pl.Series(keep))
+
+
+def batch_proximity(lat, lon, amenity_lat, amenity_lon, radius=1000,
+                    chunk_size=1024) -> tuple:
+    """ Distance to the nearest amenity, and the number of amenities within
+    radius metres, for every Lat-Long. Points are measured in chunks, so
+    memory stays at chunk_size x amenities distances
+    """
+    lat, lon = np.asarray(lat, float), np.asarray(lon, float)
+    amenity_lat = np.asarray(amenity_lat, float)
+    amenity_lon = np.asarray(amenity_lon, float)
+
+    nearest = np.full(len(lat), np.inf)
+    counts = np.zeros(len(lat), dtype=np.int64)
+    if len(amenity_lat) == 0:
+        return nearest, counts
+
+    for start in range(0, len(lat), chunk_size):
+        end = start + chunk_size
+        dist = haversine(lat[start:end, None], lon[start:end, None],
+                         (amenity_lat, amenity_lon))
+        nearest[start:end] = dist.min(axis=1)
+        counts[start:end] = (dist <= radius).sum(axis=1)
+
+    return nearest, counts
+
+
+def add_proximity(df: pl.DataFrame, amenities: pl.DataFrame, name: str,
+                  radius=1000) -> pl.DataFrame:
+    """ Add {name}_dist and {name}_count columns to a LATITUDE / LONGITUDE
+    table, such as distance to the nearest MRT for every transaction
+    """
+    nearest, counts = batch_proximity(
+        df['LATITUDE'].cast(pl.Float64).to_numpy(),
+        df['LONGITUDE'].cast(pl.Float64).to_numpy(),
+        amenities['LATITUDE'].cast(pl.Float64).to_numpy(),
+        amenities['LONGITUDE'].cast(pl.Float64).to_numpy(),
+        radius=radius,
+    )
+    return df.with_columns(
+        pl.Series(f'{name}_dist', nearest, dtype=pl.Float32),
+        pl.Series(f'{name}_count', counts, dtype=pl.UInt16),
+    )
+
+
+def build_row_index(df: pl.DataFrame, cols: list) -> dict:
+    """ Row ids of every value in each of cols, so equality filters pick
+    candidate rows without scanning the whole frame
+    """
+    index = {}
+    for col in cols:
+        keys = df[col].to_physical().to_numpy()
+        order = np.argsort(keys, kind="stable")
+        _, starts = np.unique(keys[order], return_index=True)
+        names = df[col].gather(order[starts]).to_list()
+        index[col] = dict(zip(names, np.split(order, starts[1:])))
+    return index
+
+
+def lookup_rows(index: dict, col: str, values: list) -> np.ndarray:
+    """ Sorted row ids whose col is one of values. Selections covering a
+    large share of rows are marked on a mask, which is cheaper than
+    sorting them
     """
-    
-    # TODO - Fix to fully polars dataframe 
-    df_lat = df.select('LATITUDE').to_series().to_list()
-    df_long = df.select('LONGITUDE').to_series().to_list()
+    rows = [index[col][i] for i in values if i in index[col]]
+    if not rows:
+        return np.array([], dtype=np.int64)
+
+    count = sum(len(i) for i in rows)
+    size = sum(len(i) for i in index[col].values())
+    if count * 16 < size:
+        return np.sort(np.concatenate(rows))
+    mask = np.zeros(size, dtype=bool)
+    for i in rows:
+        mask[i] = True
+    return np.flatnonzero(mask)
+
+
+def intersect_rows(rows: np.ndarray, other: np.ndarray,
+                   size: int) -> np.ndarray:
+    """ Sorted row ids in both rows and other, out of size rows, using a
+    mask instead of sorting both again
+    """
+    keep = np.zeros(size, dtype=bool)
+    keep[other] = True
+    return rows[keep[rows]]
+
+
+def street_grams(text: str, n: int = 3) -> set:
+    """ Character n-grams of a street search string """
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def build_street_index(streets: pl.Series) -> dict:
+    """ Trigram index over unique addresses, mapping each address to its
+    row ids. Addresses are far fewer than transactions, so searches run
+    on addresses and then expand to rows
+    """
+    groups = (
+        streets.to_frame("street")
+        .with_row_index("row")
+        .group_by("street", maintain_order=True)
+        .agg("row")
+    )
+    addresses = groups["street"].to_list()
+
+    grams = {}
+    for i, address in enumerate(addresses):
+        for gram in street_grams(address):
+            grams.setdefault(gram, []).append(i)
+
+    return {
+        "addresses": addresses,
+        "rows": [i.to_numpy() for i in groups["row"]],
+        "grams": {k: np.array(v) for k, v in grams.items()},
+    }
+
+
+def match_addresses(index: dict, term: str) -> list:
+    """ Ids of addresses containing term literally, case insensitive """
+    term = term.strip().upper()
+    if not term:
+        return []
+
+    # Candidates share every trigram of term, then are checked literally
+    candidates = np.arange(len(index["addresses"]))
+    for gram in street_grams(term):
+        if gram not in index["grams"]:
+            return []
+        candidates = np.intersect1d(
+            candidates, index["grams"][gram], assume_unique=True)
+
+    return [i for i in candidates if term in index["addresses"][i]]
+
 
-    df['dist'] = [geopy.distance.geodesic(
-        (float(i), float(j)), loc_ll).m for i, j in zip(df_lat, df_long)]
+def search_streets(index: dict, text: str) -> np.ndarray:
+    """ Sorted row ids of addresses matching any | separated term """
+    rows = [
+        index["rows"][i]
+        for term in text.split("|")
+        for i in match_addresses(index, term)
+    ]
+    if not rows:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(rows))
 
-    if select:
-        selected_df = df[df['dist'] <= radius].reset_index(drop=True)
-    else:
-        selected_df = df[df['dist'] > radius].reset_index(drop=True)
 
-    return selected_df
+def suggest_streets(index: dict, text: str, limit: int = 10) -> list:
+    """ Addresses matching the last | separated term, for type-ahead """
+    term = text.split("|")[-1]
+    if len(term.strip()) < 3:
+        return []
+    matches = [index["addresses"][i] for i in match_addresses(index, term)]
+    return sorted(matches)[:limit]
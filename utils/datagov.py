@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import asyncio
+import requests
+import polars as pl
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import data_process as dp
+
+# Resale flat transactions on data.gov.sg
+base_url = "https://data.gov.sg/api/action/datastore_search?resource_id="
+ext_url = "d_8b84c4ee58e3cfc0ece0d773c8ca6abc"
+full_url = base_url + ext_url
+
+# All fields used by the dashboards, so one cached copy serves both
+df_cols = [
+    "month",
+    "block",
+    "town",
+    "flat_type",
+    "street_name",
+    "storey_range",
+    "floor_area_sqm",
+    "remaining_lease",
+    "resale_price",
+]
+
+# Closed months never change, only recent months are refreshed
+cache_dir = os.environ.get("HDB_CACHE_DIR", os.path.join(".cache", "hdb"))
+fresh_hours = 12
+
+
+class DataGovClient:
+    """ Client for the data.gov.sg datastore_search API, reusing pooled
+    connections, retrying with backoff on 429 / 5xx responses and paging
+    through results with offset
+    """
+
+    def __init__(
+        self,
+        url: str = full_url,
+        page_size: int = 10000,
+        retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 30,
+    ):
+        self.url = url
+        self.page_size = page_size
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=8)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def iter_pages(
+        self,
+        filters: dict,
+        fields: list = df_cols,
+        headers: dict = None,
+        offset: int = 0,
+    ):
+        """ Yield (offset, records, total) for each page of results.
+        Pass the last seen offset back in to resume an interrupted pull
+        """
+        params = {
+            "fields": ",".join(fields),
+            "filters": json.dumps(filters),
+            "limit": self.page_size,
+        }
+        while True:
+            params["offset"] = offset
+            response = self.session.get(
+                self.url, params=params, headers=headers, timeout=self.timeout
+            )
+            response.raise_for_status()
+            result = response.json().get("result", {})
+            records = result.get("records", [])
+            total = result.get("total")
+            yield offset, records, total
+
+            # Pages can be capped below page_size by the server, so only an
+            # empty page or reaching total ends the pull
+            offset += len(records)
+            if not records:
+                break
+            if total is not None and offset >= total:
+                break
+
+    def fetch_records(
+        self, filters: dict, fields: list = df_cols, headers: dict = None
+    ):
+        """ Pull all records matching filters, returns (records, total) """
+        output, total = [], None
+        for _, records, total in self.iter_pages(filters, fields, headers):
+            output.extend(records)
+
+        if total is not None and len(output) < total:
+            print(
+                f"data.gov.sg returned {len(output):,} of {total:,} records"
+                f" for {filters}"
+            )
+        return output, total
+
+
+client = DataGovClient()
+
+
+def fetch_hdb_data(period: str, headers: dict = None):
+    """ Pull a single month of resale transactions from data.gov.sg.
+    Returns the month and whether all its records were received
+    """
+    records, total = client.fetch_records({"month": period}, headers=headers)
+    complete = total is None or len(records) >= total
+
+    if not records:
+        return pl.DataFrame(schema=df_cols), complete
+    return pl.DataFrame(records).select(df_cols), complete
+
+
+def period_closed_at(period: str) -> float:
+    """ Timestamp after which a month no longer receives new transactions,
+    the first day of the month after next
+    """
+    year, mth = map(int, period.split("-"))
+    year, mth = year + (mth + 1) // 12, (mth + 1) % 12 + 1
+    return datetime(year, mth, 1).timestamp()
+
+
+def is_open_period(period: str) -> bool:
+    """ Current and previous months can still receive new transactions """
+    return time.time() < period_closed_at(period)
+
+
+def cache_path(period: str) -> str:
+    """ Local Parquet file holding a month of transactions """
+    return os.path.join(cache_dir, f"{period}.parquet")
+
+
+def load_hdb_month(period: str, headers: dict = None) -> pl.DataFrame:
+    """ Read a month of transactions through the local Parquet cache,
+    only calling data.gov.sg when the month is missing, or its copy was
+    saved before the month closed and is older than fresh_hours
+    """
+    path = cache_path(period)
+    if os.path.exists(path):
+        saved_at = os.path.getmtime(path)
+        age_hours = (time.time() - saved_at) / 3600
+
+        # Copies saved after the month closed are final
+        if saved_at >= period_closed_at(period):
+            return pl.read_parquet(path)
+        if is_open_period(period) and age_hours < fresh_hours:
+            return pl.read_parquet(path)
+
+    try:
+        df, complete = fetch_hdb_data(period, headers=headers)
+    except requests.RequestException as e:
+        print(f"Failed to pull {period} from data.gov.sg: {e}")
+        df, complete = pl.DataFrame(schema=df_cols), False
+
+    if df.height > 0 and complete:
+        with dp.atomic_write(path) as tmp_path:
+            df.write_parquet(tmp_path)
+    elif os.path.exists(path):
+        # Serve the last good copy if data.gov.sg fails us
+        df = pl.read_parquet(path)
+    return df
+
+
+async def load_hdb_months_async(
+    periods: list, headers: dict = None, max_concurrency: int = 4
+) -> pl.DataFrame:
+    """ Read many months concurrently, with at most max_concurrency
+    requests in flight. 429s are backed off by the client's retries, and
+    all months are concatenated once at the end
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def load(period):
+        async with semaphore:
+            return await asyncio.to_thread(load_hdb_month, period, headers)
+
+    frames = await asyncio.gather(*[load(period) for period in periods])
+    frames = [i for i in frames if i.height > 0]
+    if not frames:
+        return pl.DataFrame(schema=df_cols)
+    return pl.concat(frames, how="vertical_relaxed")
+
+
+def load_hdb_months(
+    periods: list, headers: dict = None, max_concurrency: int = 4
+) -> pl.DataFrame:
+    """ Blocking wrapper of load_hdb_months_async, which also works when
+    called from inside a running event loop, e.g. at uvicorn import
+    """
+    coro = load_hdb_months_async(periods, headers, max_concurrency)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
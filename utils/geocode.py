@@ -0,0 +1,92 @@
+import os
+import requests
+import polars as pl
+from concurrent.futures import ThreadPoolExecutor
+from . import data_process as dp
+from .datagov import cache_dir, client
+
+# OneMap search API, used to geocode block + street addresses
+onemap_url = "https://www.onemap.gov.sg/api/common/elastic/search"
+
+# Coordinates only change when new blocks appear, so each unique address
+# is looked up once and kept in a local store
+geocode_path = os.path.join(cache_dir, "geocodes.parquet")
+geocode_schema = {
+    "street": pl.String,
+    "LATITUDE": pl.Float64,
+    "LONGITUDE": pl.Float64,
+}
+
+
+def load_geocodes(path: str = geocode_path) -> pl.DataFrame:
+    """ Read the address store, empty if nothing is geocoded yet """
+    if not os.path.exists(path):
+        return pl.DataFrame(schema=geocode_schema)
+    return pl.read_parquet(path)
+
+
+def fetch_geocode(address: str) -> dict:
+    """ Look up an address such as "BLK 123 ANG MO KIO AVE 3" on OneMap.
+    Coordinates are None if OneMap has no match
+    """
+    search = address.removeprefix("BLK ")
+    response = client.session.get(
+        onemap_url,
+        params={"searchVal": search, "returnGeom": "Y",
+                "getAddrDetails": "N", "pageNum": 1},
+        timeout=client.timeout,
+    )
+    response.raise_for_status()
+    results = response.json().get("results", [])
+
+    lat = float(results[0]["LATITUDE"]) if results else None
+    lon = float(results[0]["LONGITUDE"]) if results else None
+    return {"street": address, "LATITUDE": lat, "LONGITUDE": lon}
+
+
+def update_geocodes(addresses: list, path: str = geocode_path,
+                    limit: int = None, max_workers: int = 4) -> pl.DataFrame:
+    """ Geocode addresses missing from the store, up to limit per call,
+    and return the updated store. Failed lookups are retried next call
+    """
+    geocodes = load_geocodes(path)
+    known = set(geocodes["street"].to_list())
+    missing = sorted(set(addresses) - known)[:limit]
+    if not missing:
+        return geocodes
+
+    def lookup(address):
+        try:
+            return fetch_geocode(address)
+        except requests.RequestException as e:
+            print(f"Failed to geocode {address}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        found = [i for i in pool.map(lookup, missing) if i is not None]
+    if not found:
+        return geocodes
+
+    geocodes = pl.concat(
+        [geocodes, pl.DataFrame(found, schema=geocode_schema)]
+    ).unique("street", keep="last", maintain_order=True)
+    with dp.atomic_write(path) as tmp_path:
+        geocodes.write_parquet(tmp_path)
+
+    print(f"Geocoded {len(found)} of {len(missing)} new addresses")
+    return geocodes
+
+
+def add_coordinates(df: pl.DataFrame, geocodes: pl.DataFrame,
+                    on: str = "street") -> pl.DataFrame:
+    """ Join LATITUDE / LONGITUDE onto rows by address, keeping row order.
+    Addresses stored more than once use their latest coordinates, so the
+    join never duplicates rows
+    """
+    return df.join(
+        geocodes.unique("street", keep="last", maintain_order=True).select(
+            pl.col("street").alias(on),
+            pl.col("LATITUDE", "LONGITUDE").cast(pl.Float32),
+        ),
+        on=on,
+        how="left",
+    )
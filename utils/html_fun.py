@@ -1,5 +1,7 @@
 import dash_leaflet as dl
 from . import data_process as dp
+from . import spatial as sp
+from . import routing as rt
 
 
 def icon_html(icon: str, color: str, bg: str) -> str:
@@ -35,20 +37,27 @@ def create_location_map_layer(df, search_pt, boundary, icon_fun,
                               icon_color, final_msg, mp, marker_name):
     """ Takes multiple inputs to produce a map layer of certain attributions,
     such as subway or attractions. Output includes a map layer and result
-    table that lists the proximity of all selected markers
+    table that lists the proximity of all selected markers. df can be a
+    prebuilt SpatialIndex, to avoid scanning every record per search
     """
-    tmp = dp.table_select_from_pt(df, search_pt, radius=boundary)
-    if tmp.shape[1] != 0:
+    if isinstance(df, sp.SpatialIndex):
+        tmp = df.within(search_pt, boundary)
+    else:
+        tmp = dp.table_select_from_pt(df, search_pt, radius=boundary)
+    if tmp.shape[0] != 0:
         stations = dict()
         table_msg = list()
-        for i in range(tmp.shape[0]):
 
-            # Set important marker & route info
-            pt_info = tmp.loc[i]['loc_info']
-            pt_lat = tmp.loc[i]['LATITUDE']
-            pt_lon = tmp.loc[i]['LONGITUDE']
+        # Routes to every marker come from one batched, cached call
+        points = [(float(row['LATITUDE']), float(row['LONGITUDE']))
+                  for row in tmp.iter_rows(named=True)]
+        routes = rt.router.routes(search_pt, points)
+
+        for row, (pt_lat, pt_lon), (route_list, total_d) in zip(
+                tmp.iter_rows(named=True), points, routes):
 
-            route_list, total_d = dp.create_route(search_pt, (pt_lat, pt_lon))
+            # Set important marker & route info
+            pt_info = row['loc_info']
             tooltip_msg = f"<div>To {pt_info} - <b>{total_d:,.0f}m</b></div>"
 
             table_msg.append(tooltip_msg)
@@ -0,0 +1,62 @@
+import os
+import bson
+import polars as pl
+from pymongo.errors import PyMongoError
+from . import data_process as dp
+from .datagov import cache_dir
+
+# Only the columns used by the trend charts are read from MongoDB
+hist_cols = ["month", "town", "resale_price"]
+snapshot_path = os.path.join(cache_dir, "hdb_hist_v2.parquet")
+
+
+def read_frame_batches(collection, query: dict, projection: dict,
+                       batch_size: int = 50000) -> pl.DataFrame:
+    """ Stream raw BSON batches from a collection into Polars frames,
+    instead of building every document as a Python dict up front
+    """
+    frames = []
+    cursor = collection.find_raw_batches(
+        query, projection, batch_size=batch_size)
+    for batch in cursor:
+        frames.append(
+            pl.DataFrame(bson.decode_all(batch), infer_schema_length=None)
+            .select(hist_cols)
+            .with_columns(pl.col("resale_price").cast(pl.Float64))
+        )
+
+    if not frames:
+        return pl.DataFrame(
+            schema={"month": pl.String, "town": pl.String,
+                    "resale_price": pl.Float64})
+    return pl.concat(frames, how="vertical_relaxed")
+
+
+def load_history(collection, path: str = snapshot_path) -> pl.DataFrame:
+    """ Load historical transactions from a local Parquet snapshot, only
+    pulling months from MongoDB that are at or after the latest month in
+    the snapshot, and saving the updated snapshot back
+    """
+    snapshot = pl.read_parquet(path) if os.path.exists(path) else None
+    query, projection = dp.create_mdb_query_w_df_cols(hist_cols)
+
+    # The last month may have been partially loaded, so it is re-read
+    if snapshot is not None and snapshot.height > 0:
+        last_mth = snapshot["month"].max()
+        query["month"]["$gte"] = last_mth
+        snapshot = snapshot.filter(pl.col("month") < last_mth)
+
+    try:
+        new_df = read_frame_batches(collection, query, projection)
+    except PyMongoError as e:
+        print(f"Failed to read history from MongoDB: {e}")
+        if snapshot is None:
+            raise
+        return pl.read_parquet(path)
+
+    df = new_df if snapshot is None else pl.concat(
+        [snapshot, new_df], how="vertical_relaxed")
+
+    with dp.atomic_write(path) as tmp_path:
+        df.write_parquet(tmp_path)
+    return df
@@ -0,0 +1,176 @@
+import os
+import json
+import heapq
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from .datagov import cache_dir
+from .data_process import haversine
+from .spatial import SpatialIndex
+
+# Routes are reused across searches, keyed on endpoints rounded to about
+# 10 metres, so nearby clicks on the same block share one route
+route_path = os.path.join(cache_dir, "routes.sqlite")
+route_precision = 4
+
+
+class StraightLineEngine:
+    """ Routes as a straight line between the two points """
+
+    name = "straight"
+
+    def routes(self, origin: tuple, dests: list) -> list:
+        """ (positions, metres) from origin to each destination """
+        dist = haversine(
+            np.array([i[0] for i in dests]),
+            np.array([i[1] for i in dests]),
+            origin,
+        )
+        return [([list(origin), list(dest)], float(d))
+                for dest, d in zip(dests, dist)]
+
+
+class GraphEngine:
+    """ Shortest routes over a precomputed walking graph. nodes is a table
+    of LATITUDE / LONGITUDE, edges are (from, to, metres) rows between node
+    positions. Endpoints are snapped to their nearest node
+    """
+
+    name = "graph"
+
+    def __init__(self, nodes, edges: list):
+        self.lat = nodes['LATITUDE'].cast(float).to_numpy()
+        self.lon = nodes['LONGITUDE'].cast(float).to_numpy()
+        self.index = SpatialIndex(
+            nodes.select('LATITUDE', 'LONGITUDE').with_row_index('node'))
+
+        self.graph = [[] for _ in range(len(self.lat))]
+        for u, v, metres in edges:
+            self.graph[u].append((v, metres))
+            self.graph[v].append((u, metres))
+
+    def snap(self, point: tuple) -> tuple:
+        """ Nearest node to a point, and the metres to reach it """
+        row = self.index.nearest(point, k=1).row(0, named=True)
+        return row['node'], row['dist']
+
+    def shortest_paths(self, source: int) -> tuple:
+        """ Dijkstra from one node to every node """
+        dist = np.full(len(self.graph), np.inf)
+        prev = np.full(len(self.graph), -1)
+        dist[source] = 0
+        queue = [(0.0, source)]
+        while queue:
+            d, u = heapq.heappop(queue)
+            if d > dist[u]:
+                continue
+            for v, metres in self.graph[u]:
+                if d + metres < dist[v]:
+                    dist[v] = d + metres
+                    prev[v] = u
+                    heapq.heappush(queue, (dist[v], v))
+        return dist, prev
+
+    def routes(self, origin: tuple, dests: list) -> list:
+        """ One shortest path search from origin serves every destination.
+        Unreachable destinations fall back to a straight line
+        """
+        source, start_d = self.snap(origin)
+        dist, prev = self.shortest_paths(source)
+
+        output = []
+        for dest in dests:
+            target, end_d = self.snap(dest)
+            if not np.isfinite(dist[target]):
+                output.extend(StraightLineEngine().routes(origin, [dest]))
+                continue
+
+            nodes = [target]
+            while nodes[-1] != source:
+                nodes.append(prev[nodes[-1]])
+            positions = [list(origin)]
+            positions += [[self.lat[i], self.lon[i]] for i in nodes[::-1]]
+            positions.append(list(dest))
+            output.append(
+                (positions, float(start_d + dist[target] + end_d)))
+        return output
+
+
+class Router:
+    """ Route lookups through an in-memory LRU cache, then a disk cache,
+    computing only the missing routes in one batched engine call
+    """
+
+    def __init__(self, engine, path: str = route_path,
+                 maxsize: int = 4096):
+        self.engine = engine
+        self.path = path
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, origin: tuple, dest: tuple) -> str:
+        points = [round(float(i), route_precision) for i in (*origin, *dest)]
+        return f"{self.engine.name}|" + ",".join(map(str, points))
+
+    def remember(self, key: str, route: tuple):
+        with self.lock:
+            self.memory[key] = route
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+
+    @contextmanager
+    def connect(self):
+        """ Disk cache connection, committed and closed after use """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute("CREATE TABLE IF NOT EXISTS routes "
+                       "(key TEXT PRIMARY KEY, route TEXT)")
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def routes(self, origin: tuple, dests: list) -> list:
+        """ (positions, metres) from origin to each destination """
+        keys = [self.key(origin, dest) for dest in dests]
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            with self.connect() as db:
+                rows = db.execute(
+                    "SELECT key, route FROM routes WHERE key IN "
+                    f"({','.join('?' * len(missing))})", missing).fetchall()
+            for key, route in rows:
+                found[key] = tuple(json.loads(route))
+                self.remember(key, found[key])
+
+        todo = [(k, d) for k, d in dict(zip(keys, dests)).items()
+                if k not in found]
+        if todo:
+            computed = self.engine.routes(origin, [d for _, d in todo])
+            with self.connect() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO routes VALUES (?, ?)",
+                    [(k, json.dumps(r)) for (k, _), r in zip(todo, computed)])
+            for (key, _), route in zip(todo, computed):
+                found[key] = route
+                self.remember(key, route)
+
+        return [found[key] for key in keys]
+
+    def route(self, origin: tuple, dest: tuple) -> tuple:
+        return self.routes(origin, [dest])[0]
+
+
+router = Router(StraightLineEngine())
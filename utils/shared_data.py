@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import fcntl
+import polars as pl
+from contextlib import contextmanager
+from .datagov import cache_dir
+from .data_process import atomic_write
+
+# Datasets are written once as uncompressed Arrow IPC files, which every
+# worker process memory maps, so read-only data is shared by the OS page
+# cache instead of being copied into each worker. String columns are
+# stored as integer codes into a sorted label list per version, so every
+# column is a plain numeric buffer that maps without copying
+shared_dir = os.path.join(cache_dir, "shared")
+keep_versions = 3
+
+
+def frame_path(name: str, version: str) -> str:
+    return os.path.join(shared_dir, f"{name}_{version}.arrow")
+
+
+def labels_path(name: str, version: str) -> str:
+    return os.path.join(shared_dir, f"{name}_{version}.labels.json")
+
+
+def pointer_path(name: str) -> str:
+    return os.path.join(shared_dir, f"{name}.json")
+
+
+@contextmanager
+def build_lock(name: str):
+    """ Hold an exclusive file lock across processes, so only one worker
+    builds a dataset while the others wait and then map it
+    """
+    os.makedirs(shared_dir, exist_ok=True)
+    with open(os.path.join(shared_dir, f"{name}.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def latest_version(name: str, max_age_hours: float = None):
+    """ Metadata of the latest published version, or None if nothing is
+    published yet or it is older than max_age_hours
+    """
+    path = pointer_path(name)
+    if not os.path.exists(path):
+        return None
+    if max_age_hours is not None:
+        if time.time() - os.path.getmtime(path) > max_age_hours * 3600:
+            return None
+
+    with open(path) as f:
+        meta = json.load(f)
+    if not os.path.exists(frame_path(name, meta["version"])):
+        return None
+    return meta
+
+
+def publish_frame(df: pl.DataFrame, name: str, version: str, **meta):
+    """ Write a dataset version and point readers at it. All files are
+    swapped in with os.replace, so readers never see a partial write
+    """
+    df, labels = encode_labels(df)
+    with atomic_write(labels_path(name, version)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(labels, f)
+
+    with atomic_write(frame_path(name, version)) as tmp_path:
+        df.write_ipc(tmp_path, compression="uncompressed")
+
+    with atomic_write(pointer_path(name)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version, **meta}, f)
+
+    remove_old_versions(name)
+
+
+def remove_old_versions(name: str):
+    """ Keep the newest versions on disk. Mapped files stay readable by
+    workers still holding them after they are unlinked
+    """
+    prefix = f"{name}_"
+    files = sorted(
+        (i for i in os.listdir(shared_dir)
+         if i.startswith(prefix) and i.endswith(".arrow")),
+        key=lambda i: os.path.getmtime(os.path.join(shared_dir, i)),
+    )
+    for i in files[:-keep_versions]:
+        os.remove(os.path.join(shared_dir, i))
+        labels = i.removesuffix(".arrow") + ".labels.json"
+        if os.path.exists(os.path.join(shared_dir, labels)):
+            os.remove(os.path.join(shared_dir, labels))
+
+
+def encode_labels(df: pl.DataFrame) -> tuple:
+    """ Replace String and Categorical columns with UInt32 codes into
+    their sorted unique values, returning the codes and the labels
+    """
+    labels = {
+        col: df[col].cast(pl.String).drop_nulls().unique().sort().to_list()
+        for col, dtype in df.schema.items()
+        if dtype == pl.String or dtype == pl.Categorical
+    }
+    return df.with_columns(
+        pl.col(col).cast(pl.String).cast(pl.Enum(values)).to_physical()
+        for col, values in labels.items()
+    ), labels
+
+
+def decode_labels(df: pl.DataFrame, labels: dict) -> pl.DataFrame:
+    """ View code columns as Enums over their labels. The codes are not
+    copied, and as labels are sorted, Enums sort like strings
+    """
+    return df.with_columns(
+        pl.col(col).cast(pl.Enum(values))
+        for col, values in labels.items()
+        if col in df.columns
+    )
+
+
+def open_frame(name: str, version: str) -> pl.DataFrame:
+    """ Memory map a published dataset version, without copying it.
+    String columns come back as Enums
+    """
+    with open(labels_path(name, version)) as f:
+        labels = json.load(f)
+    df = pl.read_ipc(frame_path(name, version), memory_map=True)
+    return decode_labels(df, labels)
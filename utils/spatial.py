@@ -0,0 +1,133 @@
+import numpy as np
+import polars as pl
+from .data_process import earth_radius, haversine
+
+# Beyond this distance from the data, projected cells no longer bound
+# haversine distances, so nearest queries measure every row instead
+far_metres = 200000
+
+
+class SpatialIndex:
+    """ Grid index over a table of LATITUDE / LONGITUDE records. Points
+    are projected to metres and bucketed into square cells once, so radius
+    and nearest queries only measure points in nearby cells
+    """
+
+    def __init__(self, df: pl.DataFrame, cell_size: float = 500):
+        self.cell_size = cell_size
+        lat = df['LATITUDE'].cast(pl.Float64).to_numpy()
+        lon = df['LONGITUDE'].cast(pl.Float64).to_numpy()
+        self.lat0 = float(np.radians(lat.mean())) if len(lat) else 0.0
+
+        # Rows are sorted by cell, so each cell is one contiguous slice
+        cx, cy = self.cells(lat, lon)
+        order = np.lexsort((cy, cx))
+        self.df = df[order]
+        self.lat, self.lon = lat[order], lon[order]
+        cx, cy = cx[order], cy[order]
+
+        keys = np.stack([cx, cy], axis=1)
+        _, starts = np.unique(keys, axis=0, return_index=True)
+        ends = np.append(starts[1:], len(order))
+        self.buckets = {
+            (int(cx[s]), int(cy[s])): (s, e)
+            for s, e in zip(starts, ends)
+        }
+        self.bounds = (
+            (cx.min(), cx.max(), cy.min(), cy.max()) if len(order) else None)
+
+    def cells(self, lat, lon):
+        """ Grid cell of Lat-Longs, on an equirectangular projection """
+        x = earth_radius * np.radians(lon) * np.cos(self.lat0)
+        y = earth_radius * np.radians(lat)
+        return (np.floor(x / self.cell_size).astype(np.int64),
+                np.floor(y / self.cell_size).astype(np.int64))
+
+    def covers(self, cx: int, cy: int, ring: int) -> bool:
+        """ Whether ring cells around (cx, cy) include every cell """
+        if self.bounds is None:
+            return True
+        min_x, max_x, min_y, max_y = self.bounds
+        return (cx - ring <= min_x and cx + ring >= max_x
+                and cy - ring <= min_y and cy + ring >= max_y)
+
+    def gap(self, cx: int, cy: int) -> int:
+        """ Rings between (cx, cy) and the nearest cell of the data """
+        if self.bounds is None:
+            return 0
+        min_x, max_x, min_y, max_y = self.bounds
+        return int(max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0))
+
+    def candidates(self, cx: int, cy: int, ring: int,
+                   inner: int = -1) -> np.ndarray:
+        """ Row ids of cells within ring cells of (cx, cy), skipping those
+        within inner cells that were already searched. Cells outside the
+        data bounds are never visited
+        """
+        if self.bounds is None:
+            return np.array([], dtype=np.int64)
+        min_x, max_x, min_y, max_y = self.bounds
+
+        rows = []
+        for i in range(max(cx - ring, min_x), min(cx + ring, max_x) + 1):
+            if abs(i - cx) > inner:
+                js = range(cy - ring, cy + ring + 1)
+            else:
+                # Only the unsearched ends of this column are visited
+                js = [*range(cy - ring, cy - inner),
+                      *range(cy + inner + 1, cy + ring + 1)]
+            for j in js:
+                if not min_y <= j <= max_y:
+                    continue
+                if (i, j) in self.buckets:
+                    start, end = self.buckets[(i, j)]
+                    rows.append(np.arange(start, end))
+        if not rows:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(rows)
+
+    def result(self, rows: np.ndarray, dist: np.ndarray) -> pl.DataFrame:
+        order = np.argsort(dist, kind="stable")
+        return self.df[rows[order]].with_columns(
+            pl.Series('dist', dist[order]))
+
+    def within(self, loc_ll: tuple, radius: float) -> pl.DataFrame:
+        """ Records within radius metres of a Lat-Long, nearest first """
+        cx, cy = self.cells(np.array([loc_ll[0]]), np.array([loc_ll[1]]))
+
+        # One extra ring covers projection error at the cell edges
+        ring = int(np.ceil(radius / self.cell_size)) + 1
+        rows = self.candidates(int(cx[0]), int(cy[0]), ring)
+        dist = haversine(self.lat[rows], self.lon[rows], loc_ll)
+        keep = dist <= radius
+        return self.result(rows[keep], dist[keep])
+
+    def nearest(self, loc_ll: tuple, k: int = 1) -> pl.DataFrame:
+        """ k records nearest to a Lat-Long, nearest first """
+        cx, cy = self.cells(np.array([loc_ll[0]]), np.array([loc_ll[1]]))
+        cx, cy = int(cx[0]), int(cy[0])
+        rows = np.array([], dtype=np.int64)
+
+        # Start at the first ring that reaches the data, then grow the
+        # search one ring at a time, until the k-th nearest is closer than
+        # any point outside the searched rings can be
+        ring = self.gap(cx, cy)
+        if ring * self.cell_size > far_metres:
+            dist = haversine(self.lat, self.lon, loc_ll)
+            top = np.argsort(dist, kind="stable")[:k]
+            return self.result(top, dist[top])
+
+        inner = -1
+        while True:
+            rows = np.concatenate(
+                [rows, self.candidates(cx, cy, ring, inner=inner)])
+            dist = haversine(self.lat[rows], self.lon[rows], loc_ll)
+            reach = (ring - 1) * self.cell_size
+            if len(rows) >= k and np.sort(dist)[k - 1] <= reach:
+                break
+            if self.covers(cx, cy, ring):
+                break
+            inner, ring = ring, ring + 1
+
+        top = np.argsort(dist, kind="stable")[:k]
+        return self.result(rows[top], dist[top])